@@ -1,16 +1,30 @@
-import io
 import streamlit as st
-import google.generativeai as genai
-from PIL import Image
-from dotenv import load_dotenv
 import os
-import json
-import re
-from src.database import save_car, get_all_cars
+import time
+from src.config import load_env
+from src.database import get_all_cars
+from src.image_utils import to_jpeg_bytes, image_hash
+from src.image_quality import iter_frames, pick_best
+from src.image_index import find_similar
+from src.car_cache import get_cached_car
 from src.car_data import get_car_brands, get_car_models, get_car_types, get_car_data_from_brand
+from src.gemini_client import get_models, forget_api_key
+from src.prefetch import prefetch_specs, cancel_prefetch
+from src.jobs import register_handler, submit_job, get_job
+from src.car_processor import run_detection_job
+from src.spec_view import render_specs
+from src.profiling import start_run, span, render_debug_panel
 
-# Load environment variables
-load_dotenv()
+start_run('app')
+
+# Seconds between checks of a running detection
+JOB_POLL_SECONDS = 1
+
+# Detections run in the job worker pool, see src/jobs.py
+register_handler('detection', run_detection_job)
+
+# Load environment variables (once per process)
+load_env()
 
 # Initialize session states
 if 'language' not in st.session_state:
@@ -62,9 +76,6 @@ with col1:
         # Update session state
         st.session_state.api_key = api_key
         
-        # Configure Gemini API
-        genai.configure(api_key=api_key)
-        
         st.sidebar.success("API Key saved successfully / تم حفظ المفتاح بنجاح")
 
 with col2:
@@ -73,24 +84,20 @@ with col2:
         with open('.env', 'w') as f:
             f.write('GEMINI_API_KEY=')
         
+        # Drop the cached client for the old key
+        forget_api_key(st.session_state.api_key)
+        
         # Update session state
         st.session_state.api_key = ''
         
-        # Clear API configuration
-        genai.configure(api_key='')
-        
         st.sidebar.success("API Key deleted successfully / تم حذف المفتاح بنجاح")
         st.rerun()
 
-# Configure Gemini API
-if st.session_state.api_key:
-    genai.configure(api_key=st.session_state.api_key)
-else:
+if not st.session_state.api_key:
     st.warning("Please enter your Gemini API Key / الرجاء إدخال مفتاح API الخاص بك")
 
-# Initialize models
-vision_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-text_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
+# Get the models bound to this session's API key (cached per process)
+vision_model, text_model = get_models(st.session_state.api_key)
 
 # Get language-specific texts
 texts = {
@@ -111,7 +118,20 @@ texts = {
         "safety": "Safety Features",
         "comfort": "Comfort Features",
         "tech": "Technology Features",
-        "no_image": "Please upload an image first"
+        "no_image": "Please upload an image first",
+        "multi": "Several cars in the photo",
+        "no_cars": "No cars were detected in the image",
+        "unusable": "This image cannot be used",
+        "too_small": "it is too small",
+        "too_dark": "it is too dark",
+        "too_bright": "it is overexposed",
+        "blank": "it has almost no detail",
+        "blurry": "it is blurry",
+        "similar": "Similar cars in your library",
+        "reuse": "Use these specifications",
+        "detect_again": "Detect again",
+        "job_queued": "Waiting for a free slot...",
+        "job_running": "Processing... you can keep using the page"
     },
     "Arabic": {
         "title": "كاشف نوع السيارة",
@@ -130,100 +150,44 @@ texts = {
         "safety": "مميزات الأمان",
         "comfort": "مميزات الراحة",
         "tech": "المميزات التكنولوجية",
-        "no_image": "الرجاء رفع صورة أولاً"
+        "no_image": "الرجاء رفع صورة أولاً",
+        "multi": "عدة سيارات في الصورة",
+        "no_cars": "لم يتم العثور على سيارات في الصورة",
+        "unusable": "لا يمكن استخدام هذه الصورة",
+        "too_small": "الصورة صغيرة جداً",
+        "too_dark": "الصورة مظلمة جداً",
+        "too_bright": "الصورة شديدة السطوع",
+        "blank": "الصورة شبه خالية من التفاصيل",
+        "blurry": "الصورة غير واضحة",
+        "similar": "سيارات مشابهة في مكتبتك",
+        "reuse": "استخدام هذه المواصفات",
+        "detect_again": "إعادة الكشف",
+        "job_queued": "في انتظار دور المعالجة...",
+        "job_running": "جاري المعالجة... يمكنك متابعة استخدام الصفحة"
     }
 }
 
-def clean_json_string(json_str):
-    # Remove any text before or after the JSON object
-    json_match = re.search(r'\{.*\}', json_str, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(0)
-    
-    # Remove any markdown formatting
-    json_str = json_str.replace('```json', '').replace('```', '')
-    
-    # Remove any whitespace at the beginning and end
-    json_str = json_str.strip()
-    
-    return json_str
-
-def process_car(image, language):
-    try:
-        # Convert image to bytes
-        img_byte_arr = io.BytesIO()
-        if image.mode == 'RGBA':
-            image = image.convert('RGB')
-        image.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # Detect car details
-        detection_prompt = """قم بتحليل صورة السيارة وقدم المعلومات التالية بتنسيق JSON:
-        {
-            "brand": "ماركة السيارة",
-            "model": "موديل السيارة",
-            "year": "سنة التصنيع",
-            "type": "نوع السيارة (SUV, Sedan, إلخ)"
-        }
-        قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
-        
-        response = vision_model.generate_content([
-            detection_prompt,
-            {"mime_type": "image/jpeg", "data": img_byte_arr}
-        ])
-        
-        # Clean and parse the response
-        response_text = clean_json_string(response.text)
-        car_details = json.loads(response_text)
-        
-        # Get detailed specifications
-        specs_prompt = f"""قم بإنشاء مواصفات تفصيلية لسيارة {car_details['year']} {car_details['brand']} {car_details['model']} بتنسيق JSON:
-        {{
-            "basic_info": {{
-                "brand": "ماركة السيارة",
-                "model": "موديل السيارة",
-                "year": "سنة التصنيع",
-                "type": "نوع السيارة"
-            }},
-            "performance": {{
-                "fuel_consumption": "استهلاك الوقود",
-                "engine_size": "حجم المحرك",
-                "cylinders": "عدد الأسطوانات",
-                "transmission": "نوع ناقل الحركة",
-                "fuel_type": "نوع الوقود",
-                "horsepower": "قوة المحرك",
-                "torque": "عزم الدوران",
-                "top_speed": "السرعة القصوى",
-                "acceleration": "التسارع"
-            }},
-            "technical_specs": {{
-                "length": "الطول",
-                "width": "العرض",
-                "height": "الارتفاع",
-                "wheelbase": "قاعدة العجلات",
-                "weight": "الوزن",
-                "seating_capacity": "سعة المقاعد",
-                "trunk_capacity": "سعة الصندوق"
-            }},
-            "features": {{
-                "price_range": "نطاق السعر",
-                "safety_features": ["مميزات الأمان"],
-                "comfort_features": ["مميزات الراحة"],
-                "technology_features": ["المميزات التكنولوجية"]
-            }}
-        }}
-        يجب أن تكون جميع الإجابات باللغة العربية.
-        قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
-        
-        response = text_model.generate_content(specs_prompt)
-        specs_text = clean_json_string(response.text)
-        specs = json.loads(specs_text)
+def load_upload(uploaded_files):
+    """Decode the uploaded photos, pick the best frame and find similar saved cars, once per upload"""
+    upload_key = tuple(uploaded_file.file_id for uploaded_file in uploaded_files)
+    if st.session_state.get('upload_key') != upload_key:
+        from PIL import Image
+
+        with span('image.decode'):
+            frames = [frame for uploaded_file in uploaded_files
+                      for frame in iter_frames(Image.open(uploaded_file))]
         
-        return car_details, specs
+        # Check the best photo or frame locally before spending a vision call on it
+        with span('image.quality', frames=len(frames)):
+            image, quality = pick_best(frames)
         
-    except Exception as e:
-        st.error(f"خطأ في معالجة الصورة: {str(e)}")
-        return None, None
+        similar = []
+        if quality['ok']:
+            with span('image.similar'):
+                similar = find_similar(image)
+        st.session_state.upload_key = upload_key
+        st.session_state.upload = (image, quality, similar)
+    return st.session_state.upload
 
 # Title and description
 st.title(texts[st.session_state.language]["title"])
@@ -245,6 +209,12 @@ car_type = st.selectbox(
     ["SUV", "Sedan", "Hatchback", "Coupe", "Sports Car", "Pickup", "Van", "Wagon", "Convertible", "Crossover", "Luxury", "Electric", "Hybrid", "Other"]
 )
 
+# Start the spec lookup once the manual input looks like a car, so the button usually finds it cached
+prefetch_key = prefetch_specs(brand, model, year, text_model)
+if st.session_state.get('prefetch_key') not in (None, prefetch_key):
+    cancel_prefetch(st.session_state.prefetch_key)
+st.session_state.prefetch_key = prefetch_key
+
 st.markdown("---")  # Add a separator
 
 # Create two columns for upload and camera options
@@ -252,145 +222,107 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader(texts[st.session_state.language]["upload"])
-    uploaded_file = st.file_uploader(
+    uploaded_files = st.file_uploader(
         label="اختر صورة سيارة / Choose a car image",
-        type=["jpg", "jpeg", "png"],
+        type=["jpg", "jpeg", "png", "gif", "webp"],
+        accept_multiple_files=True,
         label_visibility="visible"
     )
+    multi_car = st.checkbox(texts[st.session_state.language]["multi"])
+
+# Offer saved cars that look like the upload, whose specs need no Gemini call
+if uploaded_files and not multi_car:
+    _, quality, similar = load_upload(uploaded_files)
+    if quality['ok'] and similar:
+        st.subheader(texts[st.session_state.language]["similar"])
+        for car_id, score in similar:
+            car = get_cached_car(car_id)
+            if car is None:
+                continue
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                if car['image']:
+                    st.image(car['image'], use_container_width=True)
+            with col2:
+                st.write(f"**{car['details'].get('brand', '')} {car['details'].get('model', '')} "
+                         f"{car['details'].get('year', '')}** ({score:.0%})")
+                if st.button(texts[st.session_state.language]["reuse"], key=f"reuse_{car_id}"):
+                    st.session_state.result_car_ids = [car_id]
+                    st.session_state.pop('job_id', None)
+
+def detect_again():
+    st.session_state.detect_again = True
 
-# Process button - always visible
-if st.button(texts[st.session_state.language]["detect"]):
-    if uploaded_file:
+# Process button - always visible; "Detect again" on a result runs the pipeline anew
+detect_again_requested = st.session_state.pop('detect_again', False)
+if st.button(texts[st.session_state.language]["detect"]) or detect_again_requested:
+    if uploaded_files:
         # Process image
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Image", use_container_width=True)
+        image, quality, _ = load_upload(uploaded_files)
+        if not quality['ok']:
+            reasons = ", ".join(texts[st.session_state.language][reason] for reason in quality['reasons'])
+            st.error(f"{texts[st.session_state.language]['unusable']}: {reasons}")
+            st.stop()
         
-        with st.spinner("Processing image..."):
-            car_details, specs = process_car(image, st.session_state.language)
+        # Encode once, for the vision call and the image store
+        with span('image.encode'):
+            image_bytes = to_jpeg_bytes(image)
+        payload = {'mode': 'multi' if multi_car else 'image', 'image_hash': image_hash(image_bytes)}
+        st.session_state.job_id = submit_job('detection', payload, st.session_state.api_key, image_bytes,
+                                             reuse=not detect_again_requested)
     elif brand and model and year:
         # Process manual input
-        with st.spinner("Processing car details..."):
-            # Create car details from manual input
-            car_details = {
-                'brand': brand,
-                'model': model,
-                'year': year,
-                'type': car_type
-            }
-            
-            # Get specifications using Gemini
-            specs_prompt = f"""قم بإنشاء مواصفات تفصيلية لسيارة {year} {brand} {model} بتنسيق JSON:
-            {{
-                "basic_info": {{
-                    "brand": "{brand}",
-                    "model": "{model}",
-                    "year": "{year}",
-                    "type": "{car_type}"
-                }},
-                "performance": {{
-                    "fuel_consumption": "استهلاك الوقود",
-                    "engine_size": "حجم المحرك",
-                    "cylinders": "عدد الأسطوانات",
-                    "transmission": "نوع ناقل الحركة",
-                    "fuel_type": "نوع الوقود",
-                    "horsepower": "قوة المحرك",
-                    "torque": "عزم الدوران",
-                    "top_speed": "السرعة القصوى",
-                    "acceleration": "التسارع"
-                }},
-                "technical_specs": {{
-                    "length": "الطول",
-                    "width": "العرض",
-                    "height": "الارتفاع",
-                    "wheelbase": "قاعدة العجلات",
-                    "weight": "الوزن",
-                    "seating_capacity": "سعة المقاعد",
-                    "trunk_capacity": "سعة الصندوق"
-                }},
-                "features": {{
-                    "price_range": "نطاق السعر",
-                    "safety_features": ["مميزات الأمان"],
-                    "comfort_features": ["مميزات الراحة"],
-                    "technology_features": ["المميزات التكنولوجية"]
-                }}
-            }}
-            يجب أن تكون جميع الإجابات باللغة العربية.
-            قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
-            
-            response = text_model.generate_content(specs_prompt)
-            specs_text = clean_json_string(response.text)
-            specs = json.loads(specs_text)
+        payload = {'mode': 'manual', 'details': {'brand': brand, 'model': model, 'year': year, 'type': car_type}}
+        st.session_state.job_id = submit_job('detection', payload, st.session_state.api_key,
+                                             reuse=not detect_again_requested)
     else:
         st.warning("يرجى إما رفع صورة أو إدخال بيانات السيارة / Please either upload an image or enter car details")
         st.stop()
+    st.session_state.pop('result_car_ids', None)
+
+# The latest detection runs in a worker thread, so reruns and language switches don't lose it
+job = get_job(st.session_state.job_id) if st.session_state.get('job_id') else None
+if job and job['status'] in ('queued', 'running'):
+    st.info(texts[st.session_state.language][f"job_{job['status']}"])
+    render_debug_panel()
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+elif job and job['status'] == 'failed':
+    st.error(f"خطأ في معالجة الصورة: {job['error']}")
+elif job:
+    # Keep only the saved car ids; the cars are re-rendered from the shared cache on every rerun
+    st.session_state.result_car_ids = job['result']['car_ids']
+    del st.session_state['job_id']
+    if not job['result']['car_ids']:
+        st.warning(texts[st.session_state.language]["no_cars"])
+
+# The last result, until the next detection
+cars = [car for car in map(get_cached_car, st.session_state.get('result_car_ids', [])) if car is not None]
+
+# Display specifications, under the photo (or each crop when the photo had several cars)
+for car in cars:
+    if len(cars) > 1:
+        st.subheader(f"{car['details']['brand']} {car['details']['model']} {car['details']['year']}")
+    if car['image']:
+        st.image(car['image'], use_container_width=True)
+    render_specs({**car['specs'], 'basic_info': car['details']}, st.session_state.language,
+                 car_id=car['id'], text_model=text_model)
+
+if cars:
+    col1, col2, col3 = st.columns(3)
     
-    if car_details and specs:
-        # Store car details
-        car_data = {
-            'details': car_details,
-            'specs': specs,
-            'image': image if uploaded_file else None
-        }
-        
-        # Save to database
-        save_car(car_data)
-        
-        # Display specifications
-        st.subheader(texts[st.session_state.language]["specs"])
-        
-        # Basic Information
-        st.subheader(texts[st.session_state.language]["basic_info"])
-        basic_info = specs["basic_info"]
-        st.write(f"**Brand:** {basic_info['brand']}")
-        st.write(f"**Model:** {basic_info['model']}")
-        st.write(f"**Year:** {basic_info['year']}")
-        st.write(f"**Type:** {basic_info['type']}")
-        
-        # Performance
-        st.subheader(texts[st.session_state.language]["performance"])
-        performance = specs["performance"]
-        st.write(f"**Fuel Consumption:** {performance['fuel_consumption']}")
-        st.write(f"**Engine Size:** {performance['engine_size']}")
-        st.write(f"**Cylinders:** {performance['cylinders']}")
-        st.write(f"**Transmission:** {performance['transmission']}")
-        st.write(f"**Fuel Type:** {performance['fuel_type']}")
-        st.write(f"**Horsepower:** {performance['horsepower']}")
-        st.write(f"**Torque:** {performance['torque']}")
-        st.write(f"**Top Speed:** {performance['top_speed']}")
-        st.write(f"**Acceleration:** {performance['acceleration']}")
-        
-        # Technical Specifications
-        st.subheader(texts[st.session_state.language]["technical"])
-        tech_specs = specs["technical_specs"]
-        st.write(f"**Length:** {tech_specs['length']}")
-        st.write(f"**Width:** {tech_specs['width']}")
-        st.write(f"**Height:** {tech_specs['height']}")
-        st.write(f"**Wheelbase:** {tech_specs['wheelbase']}")
-        st.write(f"**Weight:** {tech_specs['weight']}")
-        st.write(f"**Seating Capacity:** {tech_specs['seating_capacity']}")
-        st.write(f"**Trunk Capacity:** {tech_specs['trunk_capacity']}")
-        
-        # Features
-        st.subheader(texts[st.session_state.language]["features"])
-        features = specs["features"]
-        st.write(f"**{texts[st.session_state.language]['price']}:** {features['price_range']}")
-        
-        st.write(f"**{texts[st.session_state.language]['safety']}:**")
-        for feature in features["safety_features"]:
-            st.write(f"- {feature}")
-            
-        st.write(f"**{texts[st.session_state.language]['comfort']}:**")
-        for feature in features["comfort_features"]:
-            st.write(f"- {feature}")
-            
-        st.write(f"**{texts[st.session_state.language]['tech']}:**")
-        for feature in features["technology_features"]:
-            st.write(f"- {feature}")
-        
-        # Add comparison button
+    # Add comparison button
+    with col1:
         if st.button(texts[st.session_state.language]["compare"]):
             st.switch_page("pages/compare.py")
-        
-        # Add identify button
+    
+    # Add identify button
+    with col2:
         if st.button(texts[st.session_state.language]["identify"]):
-            st.switch_page("pages/identify.py") 
\ No newline at end of file
+            st.switch_page("pages/identify.py")
+    
+    # Ask Gemini again instead of reusing this result
+    with col3:
+        st.button(texts[st.session_state.language]["detect_again"], on_click=detect_again)
+
+render_debug_panel()
@@ -0,0 +1,94 @@
+"""Output size and latency of the verbose vs compact specs wire formats.
+
+Run from the project root:
+
+    python benchmarks/spec_format.py             # offline token estimate
+    python benchmarks/spec_format.py --live      # real calls, needs GEMINI_API_KEY
+
+Offline, a typical answer is serialized both ways and its tokens estimated.
+Live, each car is requested in both formats and the output tokens (from the
+response usage metadata) and model latency (from the LLM ledger, which leaves
+out the time spent waiting for the rate limiter) are compared.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.getcwd())
+
+from src.config import load_env
+from src.prompts import get_prompt, estimate_tokens
+from src.spec_format import compact_specs, expand_specs
+
+CARS = [('Toyota', 'Corolla', 2020), ('BMW', 'X5', 2022), ('Hyundai', 'Tucson', 2021)]
+
+SAMPLE_SPECS = {
+    "basic_info": {"brand": "Toyota", "model": "Corolla", "year": 2020, "type": "sedan"},
+    "performance": {"fuel_consumption": 6.5, "engine_size": 1798, "cylinders": 4,
+                    "transmission": "cvt", "fuel_type": "petrol", "horsepower": 139,
+                    "torque": 173, "top_speed": 180, "acceleration": 9.8},
+    "technical_specs": {"length": 4630, "width": 1780, "height": 1435, "wheelbase": 2700,
+                        "weight": 1310, "seating_capacity": 5, "trunk_capacity": 470},
+    "features": {"price_range": [20000, 25000],
+                 "safety_features": ["abs", "lane_departure_warning", "adaptive_cruise_control"],
+                 "comfort_features": ["dual_zone_climate_control", "heated_seats"],
+                 "technology_features": ["apple_carplay", "android_auto"]}
+}
+
+def offline():
+    # The model pretty-prints nested JSON but not flat arrays
+    verbose = json.dumps(SAMPLE_SPECS, indent=4, ensure_ascii=False)
+    compact = json.dumps(compact_specs(SAMPLE_SPECS), ensure_ascii=False)
+    assert expand_specs(json.loads(compact)) == SAMPLE_SPECS
+    print(f"{'format':<10}{'chars':>8}{'est. tokens':>14}")
+    for name, text in (('verbose', verbose), ('compact', compact)):
+        print(f"{name:<10}{len(text):>8}{estimate_tokens(text):>14}")
+
+def _output_tokens(response):
+    # usage_metadata is only returned by newer API versions; estimate without it
+    usage = getattr(response, 'usage_metadata', None)
+    tokens = getattr(usage, 'candidates_token_count', None)
+    return tokens if tokens is not None else estimate_tokens(response.text)
+
+def live(runs):
+    from src.database import flush_writes
+    from src.gemini_client import get_model
+    from src.llm_ledger import summarize
+
+    load_env()
+    model = get_model(os.getenv('GEMINI_API_KEY'))
+    if not model:
+        sys.exit("Set GEMINI_API_KEY to run the live benchmark")
+
+    since = time.time()
+    tokens = {'specs': [], 'specs_compact': []}
+    for _ in range(runs):
+        for brand, car_model, year in CARS:
+            for name in tokens:
+                prompt = get_prompt(name, 'English').render(year=year, brand=brand, model=car_model)
+                response = model.generate_content(prompt, call_type=f'benchmark_{name}')
+                tokens[name].append(_output_tokens(response))
+
+    # The ledger times the model call alone, after the request slot was granted
+    flush_writes()
+    latencies = {row['call_type']: row['avg_latency_ms'] / 1000
+                 for row in summarize(since, group_by=('call_type',))}
+    print(f"{'format':<16}{'output tokens':>15}{'avg latency s':>15}")
+    for name, samples in tokens.items():
+        print(f"{name:<16}{statistics.median(samples):>15.0f}{latencies[f'benchmark_{name}']:>15.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--live', action='store_true', help='call the Gemini API')
+    parser.add_argument('--runs', type=int, default=1, help='passes over the sample cars')
+    args = parser.parse_args()
+    if args.live:
+        live(args.runs)
+    else:
+        offline()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Time-to-first-render of each page, cold (fresh process) and warm (rerun).
+
+Run from the project root:
+
+    python benchmarks/startup.py [--runs 5] [--json results.jsonl]
+
+Each cold sample starts a new interpreter, so it includes every import and
+one-time initialization a page pays after a deploy. Warm samples rerun the
+same page in that process, which is what every widget interaction costs.
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+PAGES = ['app.py', 'pages/compare.py', 'pages/identify.py', 'pages/admin.py']
+
+# Executed in a fresh interpreter for every cold sample
+_SAMPLE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness = time.perf_counter() - start
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.session_state['api_key'] = ''
+start = time.perf_counter()
+at.run()
+cold = time.perf_counter() - start
+warm = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    at.run()
+    warm.append(time.perf_counter() - start)
+print(json.dumps({'cold': cold, 'warm': warm, 'harness': harness,
+                  'exceptions': [str(e.value) for e in at.exception]}))
+"""
+
+def sample(page, warm_runs):
+    output = subprocess.run(
+        [sys.executable, '-c', _SAMPLE, page, str(warm_runs)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='cold samples per page')
+    parser.add_argument('--warm', type=int, default=5, help='warm reruns per cold sample')
+    parser.add_argument('--json', help='append the results to this JSON lines file')
+    parser.add_argument('pages', nargs='*', default=PAGES)
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'page':<22}{'cold ms':>10}{'warm ms':>10}")
+    for page in args.pages:
+        samples = [sample(page, args.warm) for _ in range(args.runs)]
+        errors = sorted({error for s in samples for error in s['exceptions']})
+        cold = statistics.median(s['cold'] for s in samples) * 1000
+        warm = statistics.median(w for s in samples for w in s['warm']) * 1000 if args.warm else 0.0
+        print(f"{page:<22}{cold:>10.1f}{warm:>10.1f}" + (f"  errors: {errors}" if errors else ''))
+        results.append({'page': page, 'cold_ms': cold, 'warm_ms': warm, 'errors': errors})
+
+    if args.json:
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({'timestamp': time.time(), 'results': results}) + '\n')
+
+if __name__ == '__main__':
+    main()
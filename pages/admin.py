@@ -0,0 +1,200 @@
+import os
+import hmac
+import time
+import streamlit as st
+from src.config import load_env
+from src.llm_ledger import summarize, get_recent_failures
+from src.rate_limiter import get_queue_stats
+from src.prompts import measure_prompts
+from src.gemini_client import get_session_api_key, get_model
+from src.car_cache import get_cache_stats
+from src.profiling import session_memory
+from src.maintenance import storage_stats, recompress_images, prune_cars, prune_images, prune_ledger, vacuum
+
+# Language selection
+language = st.sidebar.selectbox(
+    "Select Language / اختر اللغة",
+    ["English", "Arabic"]
+)
+
+# Get language-specific texts
+texts = {
+    "English": {
+        "title": "LLM Call Ledger",
+        "description": "Latency, token and parse-failure accounting for every Gemini call",
+        "period": "Period",
+        "periods": ["Last hour", "Last 24 hours", "Last 7 days", "All time"],
+        "calls": "Calls",
+        "latency": "Total latency (s)",
+        "failures": "Parse failures",
+        "by_site": "By call site",
+        "by_site_language": "By call site and language",
+        "queue": "Rate limiter queue",
+        "recent_failures": "Recent failures",
+        "prompts": "Prompt templates",
+        "count_tokens": "Count exact tokens with the API",
+        "memory": "Memory",
+        "car_cache": "Shared car cache (MB)",
+        "session_state": "This session's state (KB)",
+        "maintenance": "Library maintenance",
+        "db_size": "Database file (MB)",
+        "db_free": "Free space in file (MB)",
+        "images": "Stored images (MB)",
+        "recompress": "Recompress images",
+        "max_side": "Longest image side (px)",
+        "max_age": "Delete cars not detected for (days, 0 = keep)",
+        "keep": "Keep only the newest cars (0 = all)",
+        "prune": "Prune",
+        "vacuum": "Compact database",
+        "confirm_recompress": "I understand stored images are replaced by smaller copies",
+        "confirm_prune": "I understand matching saved cars are deleted for good",
+        "storage": "Measure storage",
+        "done": "Done: {result}",
+        "disabled": "The admin page is disabled. Set CAR_ADMIN_PASSWORD to enable it.",
+        "password": "Admin password",
+        "wrong_password": "Wrong password.",
+        "empty": "No calls recorded yet."
+    },
+    "Arabic": {
+        "title": "سجل استدعاءات النموذج",
+        "description": "زمن الاستجابة وعدد الرموز وأخطاء التحليل لكل استدعاء لـ Gemini",
+        "period": "الفترة",
+        "periods": ["آخر ساعة", "آخر 24 ساعة", "آخر 7 أيام", "كل الوقت"],
+        "calls": "الاستدعاءات",
+        "latency": "إجمالي زمن الاستجابة (ث)",
+        "failures": "أخطاء التحليل",
+        "by_site": "حسب موقع الاستدعاء",
+        "by_site_language": "حسب موقع الاستدعاء واللغة",
+        "queue": "طابور تحديد المعدل",
+        "recent_failures": "آخر الأخطاء",
+        "prompts": "قوالب الطلبات",
+        "count_tokens": "حساب عدد الرموز بدقة عبر API",
+        "memory": "الذاكرة",
+        "car_cache": "ذاكرة السيارات المشتركة (ميغابايت)",
+        "session_state": "حالة هذه الجلسة (كيلوبايت)",
+        "maintenance": "صيانة المكتبة",
+        "db_size": "ملف قاعدة البيانات (ميغابايت)",
+        "db_free": "المساحة الفارغة في الملف (ميغابايت)",
+        "images": "الصور المخزنة (ميغابايت)",
+        "recompress": "إعادة ضغط الصور",
+        "max_side": "أطول ضلع للصورة (بكسل)",
+        "max_age": "حذف السيارات غير المكتشفة منذ (أيام، 0 = الإبقاء)",
+        "keep": "الإبقاء على أحدث السيارات فقط (0 = الكل)",
+        "prune": "تنظيف",
+        "vacuum": "ضغط قاعدة البيانات",
+        "confirm_recompress": "أفهم أن الصور المخزنة ستُستبدل بنسخ أصغر",
+        "confirm_prune": "أفهم أن السيارات المطابقة ستُحذف نهائياً",
+        "storage": "قياس التخزين",
+        "done": "تم: {result}",
+        "disabled": "صفحة الإدارة معطلة. عيّن CAR_ADMIN_PASSWORD لتفعيلها.",
+        "password": "كلمة مرور الإدارة",
+        "wrong_password": "كلمة مرور خاطئة.",
+        "empty": "لم يتم تسجيل أي استدعاءات بعد."
+    }
+}
+
+# Main title and description
+st.title(texts[language]["title"])
+st.write(texts[language]["description"])
+
+# The app serves many users, so only those with the admin password see usage or run maintenance
+load_env()
+admin_password = os.getenv('CAR_ADMIN_PASSWORD')
+if not admin_password:
+    st.warning(texts[language]["disabled"])
+    st.stop()
+if not st.session_state.get('admin_authenticated'):
+    password = st.text_input(texts[language]["password"], type="password")
+    if not password:
+        st.stop()
+    if not hmac.compare_digest(password.encode('utf-8'), admin_password.encode('utf-8')):
+        st.error(texts[language]["wrong_password"])
+        st.stop()
+    st.session_state.admin_authenticated = True
+
+period_seconds = [3600, 86400, 7 * 86400, None]
+period = st.selectbox(
+    texts[language]["period"],
+    texts[language]["periods"],
+    index=1
+)
+seconds = period_seconds[texts[language]["periods"].index(period)]
+since = time.time() - seconds if seconds else None
+
+# Memory held by saved cars shared between sessions, and by this session
+st.subheader(texts[language]["memory"])
+cache_stats = get_cache_stats()
+col1, col2 = st.columns(2)
+col1.metric(texts[language]["car_cache"],
+            f"{cache_stats['bytes'] / 2**20:.1f} / {cache_stats['max_bytes'] / 2**20:.0f}")
+memory = session_memory()
+col2.metric(texts[language]["session_state"], f"{sum(row['bytes'] for row in memory) / 1024:.1f}")
+st.dataframe([cache_stats], use_container_width=True)
+
+# Storage of cars.db and the image store, and the maintenance actions
+st.subheader(texts[language]["maintenance"])
+col1, col2, col3 = st.columns(3)
+with col1:
+    max_side = st.number_input(texts[language]["max_side"], min_value=320, value=1280, step=160)
+    confirm_recompress = st.checkbox(texts[language]["confirm_recompress"])
+    if st.button(texts[language]["recompress"], disabled=not confirm_recompress):
+        st.session_state.pop('storage', None)
+        st.success(texts[language]["done"].format(result=recompress_images(max_side)))
+with col2:
+    max_age = st.number_input(texts[language]["max_age"], min_value=0, value=0)
+    keep = st.number_input(texts[language]["keep"], min_value=0, value=0)
+    confirm_prune = st.checkbox(texts[language]["confirm_prune"])
+    if st.button(texts[language]["prune"], disabled=not confirm_prune):
+        st.session_state.pop('storage', None)
+        result = {'cars': prune_cars(max_age or None, keep or None), 'images': prune_images()}
+        if max_age:
+            result['ledger_rows'] = prune_ledger(max_age)
+        st.success(texts[language]["done"].format(result=result))
+with col3:
+    if st.button(texts[language]["vacuum"]):
+        st.session_state.pop('storage', None)
+        st.success(texts[language]["done"].format(result=f"{vacuum() / 2**20:.1f} MB"))
+
+# Measuring reads every column and walks the image store, so only on request
+if st.button(texts[language]["storage"]):
+    st.session_state.storage = storage_stats()
+storage = st.session_state.get('storage')
+if storage:
+    col1, col2, col3 = st.columns(3)
+    col1.metric(texts[language]["db_size"], f"{storage['file_bytes'] / 2**20:.1f}")
+    col2.metric(texts[language]["db_free"], f"{storage['free_bytes'] / 2**20:.1f}")
+    col3.metric(texts[language]["images"], f"{storage['images']['bytes'] / 2**20:.1f}")
+    st.dataframe([{'table': table['table'], 'rows': table['rows'], 'bytes': table['bytes'],
+                   **{f"{column} bytes": size for column, size in table['columns'].items() if size}}
+                  for table in storage['tables']], use_container_width=True)
+
+# Input size of every prompt template
+st.subheader(texts[language]["prompts"])
+model = get_model(get_session_api_key())
+if model and st.button(texts[language]["count_tokens"]):
+    st.dataframe(measure_prompts(model), use_container_width=True)
+else:
+    st.dataframe(measure_prompts(), use_container_width=True)
+
+by_site = summarize(since, group_by=('call_type',))
+if not by_site:
+    st.info(texts[language]["empty"])
+    st.stop()
+
+# Totals
+col1, col2, col3 = st.columns(3)
+col1.metric(texts[language]["calls"], sum(row['calls'] for row in by_site))
+col2.metric(texts[language]["latency"], f"{sum(row['total_latency_ms'] or 0 for row in by_site) / 1000:.1f}")
+col3.metric(texts[language]["failures"], sum(row['parse_failures'] or 0 for row in by_site))
+
+st.subheader(texts[language]["by_site"])
+st.dataframe(by_site, use_container_width=True)
+
+st.subheader(texts[language]["by_site_language"])
+st.dataframe(summarize(since), use_container_width=True)
+
+st.subheader(texts[language]["queue"])
+st.dataframe(get_queue_stats(), use_container_width=True)
+
+st.subheader(texts[language]["recent_failures"])
+st.dataframe(get_recent_failures(), use_container_width=True)
@@ -1,11 +1,18 @@
 import streamlit as st
-import google.generativeai as genai
-from dotenv import load_dotenv
-import os
 import json
 import re
-from src.database import get_all_cars, delete_car
+from src.car_cache import get_cached_car
+from src.database import PAGE_SIZE, query_cars, count_cars, get_filter_options, delete_car
+from src.gemini_client import get_session_api_key, get_model
+from src.llm_ledger import load_json
+from src.prompts import get_prompt
+from src.profiling import start_run, span, profiled, render_debug_panel
+from src.spec_index import similar_cars
+from src.spec_view import render_specs
 
+start_run('compare')
+
+@profiled('json.clean')
 def clean_json_string(json_str):
     # Remove any text before or after the JSON object
     json_match = re.search(r'\{.*\}', json_str, re.DOTALL)
@@ -20,23 +27,12 @@ def clean_json_string(json_str):
     
     return json_str
 
-# Load environment variables
-load_dotenv()
-
-# Configure Gemini API
-api_key = st.session_state.get('api_key', os.getenv('GEMINI_API_KEY', ''))
-if api_key:
-    genai.configure(api_key=api_key)
-else:
+# Get the model bound to this session's API key
+model = get_model(get_session_api_key())
+if not model:
     st.warning("يرجى إدخال مفتاح Gemini API في الصفحة الرئيسية أولاً.")
     st.stop()
 
-# Initialize model
-model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-
-# Get all cars from database
-detected_cars = get_all_cars()
-
 # Language selection
 language = st.sidebar.selectbox(
     "Select Language / اختر اللغة",
@@ -67,7 +63,17 @@ texts = {
         "price": "Price Range",
         "safety": "Safety Features",
         "comfort": "Comfort Features",
-        "tech": "Technology Features"
+        "tech": "Technology Features",
+        "filters": "Filters",
+        "all": "All",
+        "brand": "Brand",
+        "type": "Type",
+        "years": "Years",
+        "page_size": "Cars per page",
+        "page": "Page",
+        "showing": "{count} cars, page {page} of {pages}",
+        "similar": "Similar cars in your library",
+        "no_similar": "Not enough known specifications to find similar cars."
     },
     "Arabic": {
         "title": "مقارنة السيارات",
@@ -91,7 +97,17 @@ texts = {
         "price": "نطاق السعر",
         "safety": "مميزات الأمان",
         "comfort": "مميزات الراحة",
-        "tech": "المميزات التكنولوجية"
+        "tech": "المميزات التكنولوجية",
+        "filters": "التصفية",
+        "all": "الكل",
+        "brand": "الشركة المصنعة",
+        "type": "الفئة",
+        "years": "السنوات",
+        "page_size": "عدد السيارات في الصفحة",
+        "page": "الصفحة",
+        "showing": "{count} سيارة، الصفحة {page} من {pages}",
+        "similar": "سيارات مشابهة في مكتبتك",
+        "no_similar": "لا توجد مواصفات معروفة كافية للعثور على سيارات مشابهة."
     }
 }
 
@@ -102,207 +118,150 @@ st.write(texts[language]["description"])
 # Display detected cars
 st.subheader(texts[language]["detected_cars"])
 
-if not detected_cars:
+if not count_cars():
     st.warning(texts[language]["no_cars"])
     st.stop()
 
-# Initialize selected cars in session state if not exists
-if 'selected_cars' not in st.session_state:
-    st.session_state.selected_cars = []
+# Selection is kept as car ids; the cars themselves come from the shared cache
+if 'selected_car_ids' not in st.session_state:
+    st.session_state.selected_car_ids = []
 
-# Display cars in a grid
-cols = st.columns(3)
-for i, car in enumerate(detected_cars):
-    with cols[i % 3]:
-        if car['image'] is not None:
-            st.image(car['image'], width=200)
+# Filters, applied by the database query
+options = get_filter_options()
+with st.expander(texts[language]["filters"]):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        brand_filter = st.selectbox(texts[language]["brand"], [texts[language]["all"]] + options['brands'])
+    with col2:
+        type_filter = st.selectbox(texts[language]["type"], [texts[language]["all"]] + options['types'])
+    with col3:
+        year_min, year_max = options['years']
+        if year_min and year_max and year_min < year_max:
+            year_min, year_max = st.slider(texts[language]["years"], year_min, year_max, (year_min, year_max))
         else:
-            st.write("لا توجد صورة / No image available")
-        st.write(f"**{car['details']['brand']} {car['details']['model']} ({car['details']['year']})**")
-        st.write(f"**Type:** {car['details']['type']}")
+            year_min = year_max = None
+
+filters = {
+    'brand': None if brand_filter == texts[language]["all"] else brand_filter,
+    'car_type': None if type_filter == texts[language]["all"] else type_filter,
+    'year_min': year_min,
+    'year_max': year_max
+}
+
+# Only the cars of the current page are loaded and get widgets
+page_sizes = sorted({6, 12, 24, 48, PAGE_SIZE})
+page_size = st.sidebar.selectbox(texts[language]["page_size"], page_sizes, index=page_sizes.index(PAGE_SIZE))
+matching = count_cars(**filters)
+page_count = max(1, -(-matching // page_size))
+# Start again from the first page whenever the filters or the page size change
+page_key = 'page_' + '_'.join(str(value) for value in (*filters.values(), page_size))
+page = st.number_input(texts[language]["page"], min_value=1, max_value=page_count, value=1,
+                       key=page_key) if page_count > 1 else 1
+st.caption(texts[language]["showing"].format(count=matching, page=page, pages=page_count))
+page_cars = query_cars(**filters, limit=page_size, offset=(page - 1) * page_size)
+selected_ids = set(st.session_state.selected_car_ids)
+
+# Display cars in a grid
+with span('render.grid', cars=len(page_cars)):
+    cols = st.columns(3)
+    for i, car in enumerate(page_cars):
+        number = (page - 1) * page_size + i + 1
+        with cols[i % 3]:
+            if car['image'] is not None:
+                st.image(car['image'], width=200)
+            else:
+                st.write("لا توجد صورة / No image available")
+            st.write(f"**{car['details']['brand']} {car['details']['model']} ({car['details']['year']})**")
+            st.write(f"**Type:** {car['details']['type']}")
         
-        # Create three columns for buttons
-        col1, col2, col3 = st.columns(3)
+            # Create three columns for buttons
+            col1, col2, col3 = st.columns(3)
         
-        with col1:
-            # View button
-            if st.button(f"{texts[language]['view']} {i+1}", key=f"view_{i}"):
-                st.session_state['viewing_car'] = car
-                st.rerun()
+            # Widget keys use the car id, so they stay the same across pages and deletes
+            with col1:
+                # View button
+                if st.button(f"{texts[language]['view']} {number}", key=f"view_{car['id']}"):
+                    st.session_state['viewing_car_id'] = car['id']
+                    st.rerun()
         
-        with col2:
-            # Compare checkbox
-            if st.checkbox(f"{texts[language]['compare']} {i+1}", key=f"compare_{i}"):
-                if car not in st.session_state.selected_cars:
-                    st.session_state.selected_cars.append(car)
-            else:
-                if car in st.session_state.selected_cars:
-                    st.session_state.selected_cars.remove(car)
+            with col2:
+                # Compare checkbox
+                if st.checkbox(f"{texts[language]['compare']} {number}", key=f"compare_{car['id']}",
+                               value=car['id'] in selected_ids):
+                    if car['id'] not in selected_ids:
+                        st.session_state.selected_car_ids.append(car['id'])
+                else:
+                    if car['id'] in selected_ids:
+                        st.session_state.selected_car_ids.remove(car['id'])
         
-        with col3:
-            # Delete button
-            if st.button(f"{texts[language]['delete']} {i+1}", key=f"delete_{i}"):
-                if st.checkbox(texts[language]["delete_confirm"], key=f"confirm_delete_{i}"):
-                    delete_car(car['id'])
-                    st.rerun()
+            with col3:
+                # Delete button
+                if st.button(f"{texts[language]['delete']} {number}", key=f"delete_{car['id']}"):
+                    if st.checkbox(texts[language]["delete_confirm"], key=f"confirm_delete_{car['id']}"):
+                        delete_car(car['id'])
+                        if car['id'] in selected_ids:
+                            st.session_state.selected_car_ids.remove(car['id'])
+                        st.rerun()
 
 # Check if we're viewing a car's details
-if 'viewing_car' in st.session_state:
-    car = st.session_state['viewing_car']
+car = get_cached_car(st.session_state['viewing_car_id']) if 'viewing_car_id' in st.session_state else None
+if car is not None:
     
     # Display car details
     st.subheader(f"{car['details']['brand']} {car['details']['model']} ({car['details']['year']})")
     
-    # Basic Information
-    st.subheader(texts[language]["basic_info"])
-    st.write(f"**Brand:** {car['details']['brand']}")
-    st.write(f"**Model:** {car['details']['model']}")
-    st.write(f"**Year:** {car['details']['year']}")
-    st.write(f"**Type:** {car['details']['type']}")
-    
-    # Performance
-    st.subheader(texts[language]["performance"])
-    performance = car['specs']['performance']
-    st.write(f"**Fuel Consumption:** {performance['fuel_consumption']}")
-    st.write(f"**Engine Size:** {performance['engine_size']}")
-    st.write(f"**Cylinders:** {performance['cylinders']}")
-    st.write(f"**Transmission:** {performance['transmission']}")
-    st.write(f"**Fuel Type:** {performance['fuel_type']}")
-    st.write(f"**Horsepower:** {performance['horsepower']}")
-    st.write(f"**Torque:** {performance['torque']}")
-    st.write(f"**Top Speed:** {performance['top_speed']}")
-    st.write(f"**Acceleration:** {performance['acceleration']}")
+    # Basic information as detected, then the specifications
+    render_specs({**car['specs'], 'basic_info': car['details']}, language, car_id=car['id'], text_model=model)
     
-    # Technical Specifications
-    st.subheader(texts[language]["technical"])
-    tech_specs = car['specs']['technical_specs']
-    st.write(f"**Length:** {tech_specs['length']}")
-    st.write(f"**Width:** {tech_specs['width']}")
-    st.write(f"**Height:** {tech_specs['height']}")
-    st.write(f"**Wheelbase:** {tech_specs['wheelbase']}")
-    st.write(f"**Weight:** {tech_specs['weight']}")
-    st.write(f"**Seating Capacity:** {tech_specs['seating_capacity']}")
-    st.write(f"**Trunk Capacity:** {tech_specs['trunk_capacity']}")
-    
-    # Features
-    st.subheader(texts[language]["features"])
-    features = car['specs']['features']
-    st.write(f"**{texts[language]['price']}:** {features['price_range']}")
-    
-    st.write(f"**{texts[language]['safety']}:**")
-    for feature in features["safety_features"]:
-        st.write(f"- {feature}")
-        
-    st.write(f"**{texts[language]['comfort']}:**")
-    for feature in features["comfort_features"]:
-        st.write(f"- {feature}")
-        
-    st.write(f"**{texts[language]['tech']}:**")
-    for feature in features["technology_features"]:
-        st.write(f"- {feature}")
+    # Nearest saved cars by numeric specifications, without any model call
+    st.subheader(texts[language]["similar"])
+    with span('similar.specs'):
+        similar = [(get_cached_car(car_id), score) for car_id, score in similar_cars(car['id'])]
+    similar = [(similar_car, score) for similar_car, score in similar if similar_car is not None]
+    if not similar:
+        st.info(texts[language]["no_similar"])
+    for similar_car, score in similar:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.write(f"{similar_car['details'].get('brand', '')} {similar_car['details'].get('model', '')} "
+                     f"({similar_car['details'].get('year', '')}) - {score:.0%}")
+        with col2:
+            if st.button(texts[language]["view"], key=f"similar_{similar_car['id']}"):
+                st.session_state['viewing_car_id'] = similar_car['id']
+                st.rerun()
     
     # Back button
     if st.button("Back to Comparison"):
-        del st.session_state['viewing_car']
+        del st.session_state['viewing_car_id']
         st.rerun()
     
+    render_debug_panel()
     st.stop()
 
 # Compare selected cars
-if len(st.session_state.selected_cars) >= 2:
+if len(st.session_state.selected_car_ids) >= 2:
     if st.button(texts[language]["compare"]):
         try:
-            car1 = st.session_state.selected_cars[0]
-            car2 = st.session_state.selected_cars[1]
+            # Cars deleted since they were selected are skipped
+            selected_cars = [car for car in map(get_cached_car, st.session_state.selected_car_ids) if car]
+            if len(selected_cars) < 2:
+                raise Exception("لم تعد إحدى السيارات المختارة موجودة")
+            car1, car2 = selected_cars[:2]
             
             # Get specifications for both cars
-            prompt = f"""قم بمقارنة السيارتين التاليتين مع التركيز على المخرجات والمواصفات الفنية المهمة للمشتري:
-            
-            السيارة الأولى: {car1['details']['year']} {car1['details']['brand']} {car1['details']['model']}
-            السيارة الثانية: {car2['details']['year']} {car2['details']['brand']} {car2['details']['model']}
-            
-            قدم المقارنة بالتنسيق التالي:
-            {{
-                "engine_comparison": {{
-                    "car1": {{
-                        "power": "قوة المحرك بالحصان",
-                        "torque": "عزم الدوران",
-                        "acceleration": "التسارع من 0-100 كم/س",
-                        "top_speed": "السرعة القصوى"
-                    }},
-                    "car2": {{
-                        "power": "قوة المحرك بالحصان",
-                        "torque": "عزم الدوران",
-                        "acceleration": "التسارع من 0-100 كم/س",
-                        "top_speed": "السرعة القصوى"
-                    }},
-                    "winner": "السيارة الأفضل من حيث الأداء",
-                    "reason": "سبب التفوق في الأداء"
-                }},
-                "fuel_efficiency": {{
-                    "car1": {{
-                        "city": "استهلاك الوقود في المدينة",
-                        "highway": "استهلاك الوقود على الطرق السريعة",
-                        "combined": "متوسط استهلاك الوقود"
-                    }},
-                    "car2": {{
-                        "city": "استهلاك الوقود في المدينة",
-                        "highway": "استهلاك الوقود على الطرق السريعة",
-                        "combined": "متوسط استهلاك الوقود"
-                    }},
-                    "winner": "السيارة الأكثر كفاءة في استهلاك الوقود",
-                    "reason": "سبب التفوق في كفاءة استهلاك الوقود"
-                }},
-                "maintenance": {{
-                    "car1": {{
-                        "service_interval": "فترة الصيانة",
-                        "maintenance_cost": "تكلفة الصيانة",
-                        "reliability": "الموثوقية"
-                    }},
-                    "car2": {{
-                        "service_interval": "فترة الصيانة",
-                        "maintenance_cost": "تكلفة الصيانة",
-                        "reliability": "الموثوقية"
-                    }},
-                    "winner": "السيارة الأقل تكلفة في الصيانة",
-                    "reason": "سبب التفوق في الصيانة"
-                }},
-                "value_for_money": {{
-                    "car1": {{
-                        "price": "السعر",
-                        "resale_value": "قيمة إعادة البيع",
-                        "features": "المميزات مقابل السعر"
-                    }},
-                    "car2": {{
-                        "price": "السعر",
-                        "resale_value": "قيمة إعادة البيع",
-                        "features": "المميزات مقابل السعر"
-                    }},
-                    "winner": "السيارة الأفضل من حيث القيمة مقابل السعر",
-                    "reason": "سبب التفوق في القيمة مقابل السعر"
-                }},
-                "final_recommendation": {{
-                    "best_choice": "السيارة الموصى بها للشراء",
-                    "reason": "سبب التوصية",
-                    "suitable_for": "مناسبة لمن؟",
-                    "considerations": "نقاط يجب مراعاتها قبل الشراء"
-                }}
-            }}
-            
-            يجب أن تكون جميع الإجابات باللغة العربية.
-            قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
+            prompt = get_prompt('comparison', 'Arabic').render(
+                car1=f"{car1['details']['year']} {car1['details']['brand']} {car1['details']['model']}",
+                car2=f"{car2['details']['year']} {car2['details']['brand']} {car2['details']['model']}"
+            )
             
-            response = model.generate_content(prompt)
+            response = model.generate_content(prompt, call_type='comparison', language='Arabic')
             
             # Clean and parse the response
             response_text = clean_json_string(response.text)
             
-            # Debug: Print the cleaned response
-            st.write("الاستجابة بعد التنظيف:", response_text)
-            
             # Try to parse the JSON
             try:
-                comparison = json.loads(response_text)
+                comparison = load_json(response, response_text)
                 
                 # Display comparison results
                 st.subheader("مقارنة المحرك والأداء")
@@ -394,64 +353,4 @@ if len(st.session_state.selected_cars) >= 2:
 else:
     st.warning("يجب اختيار سيارتين على الأقل للمقارنة")
 
-def compare_cars(car1, car2, language):
-    try:
-        # Prepare the comparison prompt
-        comparison_prompt = f"""قم بمقارنة السيارتين التاليتين:
-        السيارة الأولى: {car1['details']['year']} {car1['details']['brand']} {car1['details']['model']}
-        السيارة الثانية: {car2['details']['year']} {car2['details']['brand']} {car2['details']['model']}
-        
-        قم بإرجاع النتيجة بتنسيق JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن.
-        يجب أن تكون جميع الإجابات باللغة العربية.
-        
-        {{
-            "general_comparison": {{
-                "winner": "السيارة الفائزة في المقارنة العامة",
-                "reason": "سبب الفوز"
-            }},
-            "performance": {{
-                "car1": "أداء السيارة الأولى",
-                "car2": "أداء السيارة الثانية",
-                "winner": "السيارة الأفضل في الأداء",
-                "reason": "سبب التفوق في الأداء"
-            }},
-            "technical_specs": {{
-                "car1": "المواصفات الفنية للسيارة الأولى",
-                "car2": "المواصفات الفنية للسيارة الثانية",
-                "winner": "السيارة الأفضل في المواصفات الفنية",
-                "reason": "سبب التفوق في المواصفات الفنية"
-            }},
-            "features": {{
-                "car1": "مميزات السيارة الأولى",
-                "car2": "مميزات السيارة الثانية",
-                "winner": "السيارة الأفضل في المميزات",
-                "reason": "سبب التفوق في المميزات"
-            }},
-            "recommendation": {{
-                "best_choice": "السيارة الموصى بها",
-                "reason": "سبب التوصية",
-                "suitable_for": "مناسبة لمن؟"
-            }}
-        }}"""
-        
-        # Generate comparison
-        response = model.generate_content(comparison_prompt)
-        
-        # Clean and parse the response
-        response_text = clean_json_string(response.text)
-        
-        # Debug: Print the cleaned response
-        st.write("الاستجابة بعد التنظيف:", response_text)
-        
-        # Try to parse the JSON
-        try:
-            comparison = json.loads(response_text)
-            return comparison
-        except json.JSONDecodeError as e:
-            st.error(f"خطأ في تحليل استجابة المقارنة: {str(e)}")
-            st.error(f"الاستجابة الخام: {response.text}")
-            return None
-            
-    except Exception as e:
-        st.error(f"خطأ في مقارنة السيارات: {str(e)}")
-        return None 
\ No newline at end of file
+render_debug_panel()
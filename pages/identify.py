@@ -1,20 +1,17 @@
 import streamlit as st
-import google.generativeai as genai
-from dotenv import load_dotenv
-import os
-import json
-import re
-from PIL import Image
-import io
+from src.gemini_client import get_session_api_key, get_model
+from src.image_quality import assess_image
+from src.image_utils import to_jpeg_bytes, image_hash
+from src.interior import describe_interiors
+from src.profiling import start_run, span, render_debug_panel
 
-# Load environment variables
-load_dotenv()
+start_run('identify')
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-
-# Initialize model
-vision_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
+# Get the model bound to this session's API key
+vision_model = get_model(get_session_api_key())
+if not vision_model:
+    st.warning("يرجى إدخال مفتاح Gemini API في الصفحة الرئيسية أولاً.")
+    st.stop()
 
 # Language selection
 language = st.sidebar.selectbox(
@@ -26,19 +23,33 @@ language = st.sidebar.selectbox(
 texts = {
     "English": {
         "title": "Car Interior Identifier",
-        "description": "Upload an image to identify objects inside a car",
-        "upload": "Upload an image",
+        "description": "Upload one or more photos to identify objects inside a car",
+        "upload": "Upload images",
         "identify": "Tell me what this is",
         "no_image": "Please upload an image first",
-        "error": "Error processing image"
+        "error": "Error processing image",
+        "result": "Analysis result",
+        "unusable": "This image cannot be used",
+        "too_small": "it is too small",
+        "too_dark": "it is too dark",
+        "too_bright": "it is overexposed",
+        "blank": "it has almost no detail",
+        "blurry": "it is blurry"
     },
     "Arabic": {
         "title": "معرف محتويات السيارة",
-        "description": "قم برفع صورة للتعرف على الأشياء داخل السيارة",
-        "upload": "رفع صورة",
+        "description": "قم برفع صورة أو أكثر للتعرف على الأشياء داخل السيارة",
+        "upload": "رفع صور",
         "identify": "اخبرني ما هذا",
         "no_image": "الرجاء رفع صورة أولاً",
-        "error": "خطأ في معالجة الصورة"
+        "error": "خطأ في معالجة الصورة",
+        "result": "نتيجة التحليل",
+        "unusable": "لا يمكن استخدام هذه الصورة",
+        "too_small": "الصورة صغيرة جداً",
+        "too_dark": "الصورة مظلمة جداً",
+        "too_bright": "الصورة شديدة السطوع",
+        "blank": "الصورة شبه خالية من التفاصيل",
+        "blurry": "الصورة غير واضحة"
     }
 }
 
@@ -46,52 +57,67 @@ texts = {
 st.title(texts[language]["title"])
 st.write(texts[language]["description"])
 
-# Upload image
+# Upload images
 st.subheader(texts[language]["upload"])
-uploaded_file = st.file_uploader("", type=["jpg", "jpeg", "png"])
+uploaded_files = st.file_uploader(texts[language]["upload"], type=["jpg", "jpeg", "png"],
+                                  accept_multiple_files=True, label_visibility="collapsed")
+
+def load_photos(uploaded_files):
+    """Decode, check and encode the uploaded photos once per upload"""
+    upload_key = tuple(uploaded_file.file_id for uploaded_file in uploaded_files)
+    if st.session_state.get('interior_upload_key') != upload_key:
+        from PIL import Image
+
+        photos = []
+        for uploaded_file in uploaded_files:
+            with span('image.decode'):
+                image = Image.open(uploaded_file)
+                image.load()
+            # Check each photo locally, before any vision call
+            with span('image.quality'):
+                quality = assess_image(image)
+            with span('image.encode'):
+                data = to_jpeg_bytes(image)
+            photos.append({'name': uploaded_file.name, 'data': data, 'hash': image_hash(data),
+                           'quality': quality})
+        st.session_state.interior_upload_key = upload_key
+        st.session_state.interior_photos = photos
+    return st.session_state.interior_photos
 
-# Process the image
-if uploaded_file:
-    # Get the image
-    image = Image.open(uploaded_file)
+# Process the images
+if uploaded_files:
+    photos = load_photos(uploaded_files)
     
-    # Display the image
-    st.image(image, caption="Uploaded Image", use_container_width=True)
+    # Display the images
+    columns = st.columns(min(len(photos), 3))
+    for number, photo in enumerate(photos):
+        with columns[number % len(columns)]:
+            st.image(photo['data'], caption=photo['name'], use_container_width=True)
+            if not photo['quality']['ok']:
+                reasons = ", ".join(texts[language][reason] for reason in photo['quality']['reasons'])
+                st.error(f"{texts[language]['unusable']}: {reasons}")
+    usable = [photo for photo in photos if photo['quality']['ok']]
     
     # Process button
-    if st.button(texts[language]["identify"]):
+    if usable and st.button(texts[language]["identify"]):
         try:
-            # Convert image to bytes
-            img_byte_arr = io.BytesIO()
-            
-            # Convert image to RGB if necessary
-            if image.mode in ['RGBA', 'P']:
-                image = image.convert('RGB')
-            
-            image.save(img_byte_arr, format='JPEG')
-            img_byte_arr = img_byte_arr.getvalue()
+            # All the photos go in one request; photos seen before come from the cache
+            with st.spinner(texts[language]["identify"]):
+                descriptions = describe_interiors([(photo['hash'], photo['data']) for photo in usable],
+                                                  vision_model, language)
             
-            # Identify objects in the image
-            prompt = """قم بتحليل الصورة ووصف ما تراه باللغة العربية. 
-            ركز على الأشياء الموجودة داخل السيارة وقدم وصفاً مفصلاً لكل شيء.
-            قم بتحديد:
-            1. نوع الشيء أو القطعة
-            2. موقعها في السيارة
-            3. وظيفتها
-            4. أي تفاصيل إضافية مهمة
-            
-            يجب أن تكون الإجابة باللغة العربية وبشكل منظم وواضح."""
-            
-            response = vision_model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": img_byte_arr}
-            ])
-            
-            # Display the identification results
-            st.subheader("نتيجة التحليل")
-            st.write(response.text)
+            # Display the identification results, one section per photo
+            st.subheader(texts[language]["result"])
+            for photo, description in zip(usable, descriptions):
+                col1, col2 = st.columns([1, 3])
+                with col1:
+                    st.image(photo['data'], caption=photo['name'], use_container_width=True)
+                with col2:
+                    st.markdown(description or "-")
             
         except Exception as e:
             st.error(f"{texts[language]['error']}: {str(e)}")
 else:
-    st.warning(texts[language]["no_image"]) 
\ No newline at end of file
+    st.warning(texts[language]["no_image"]) 
+
+render_debug_panel()
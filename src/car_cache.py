@@ -0,0 +1,73 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from src.config import load_env
+from src.database import get_car, add_change_listener
+
+load_env()
+
+# Memory shared by all sessions for saved cars (mostly image bytes)
+MAX_BYTES = int(os.getenv('CAR_CACHE_MAX_MB', '64')) * 1024 * 1024
+
+_lock = threading.Lock()
+_cars = OrderedDict()
+_sizes = {}
+_stats = {'hits': 0, 'misses': 0, 'bytes': 0}
+# Incremented on every change, so a row read before a change is not cached after it
+_version = 0
+
+def _car_size(car):
+    return (len(car['image'] or b'') + len(json.dumps(car['details'], ensure_ascii=False))
+            + len(json.dumps(car['specs'], ensure_ascii=False)))
+
+def get_cached_car(car_id):
+    """Get a saved car by id through the shared cache, or None if it was deleted.
+
+    The returned dict is shared between sessions and must not be modified.
+    """
+    with _lock:
+        car = _cars.get(car_id)
+        if car is not None:
+            _cars.move_to_end(car_id)
+            _stats['hits'] += 1
+            return car
+        _stats['misses'] += 1
+        version = _version
+
+    car = get_car(car_id)
+    if car is None:
+        return None
+    size = _car_size(car)
+    with _lock:
+        if car_id not in _cars and size <= MAX_BYTES and version == _version:
+            _cars[car_id] = car
+            _sizes[car_id] = size
+            _stats['bytes'] += size
+            # Drop the least recently used cars until the cache fits again
+            while _stats['bytes'] > MAX_BYTES:
+                old_id, _ = _cars.popitem(last=False)
+                _stats['bytes'] -= _sizes.pop(old_id)
+    return car
+
+def forget_car(car_id):
+    """Drop a car from the cache after it was changed or deleted"""
+    with _lock:
+        if _cars.pop(car_id, None) is not None:
+            _stats['bytes'] -= _sizes.pop(car_id)
+
+def get_cache_stats():
+    """Get the size and hit counts of the shared car cache"""
+    with _lock:
+        return {'cars': len(_cars), 'bytes': _stats['bytes'], 'max_bytes': MAX_BYTES,
+                'hits': _stats['hits'], 'misses': _stats['misses']}
+
+def _on_change(event, car_ids):
+    global _version
+    with _lock:
+        _version += 1
+    for car_id in car_ids:
+        forget_car(car_id)
+
+# Saved cars can be updated in place (upserts), so drop them on every change
+add_change_listener(_on_change)
@@ -1,58 +1,24 @@
 import json
-import google.generativeai as genai
+from src.llm_ledger import load_json
+from src.prompts import get_prompt
 
 def compare_cars(car1_specs, car2_specs, model):
     try:
-        prompt = f"""
-        Compare these two cars and provide a detailed analysis:
+        prompt = get_prompt('comparison_text', 'English').render(
+            car1=json.dumps(car1_specs, separators=(',', ':')),
+            car2=json.dumps(car2_specs, separators=(',', ':'))
+        )
         
-        Car 1:
-        {json.dumps(car1_specs, indent=2)}
-        
-        Car 2:
-        {json.dumps(car2_specs, indent=2)}
-        
-        Provide the comparison in the following format:
-        1. Overall Comparison
-        2. Performance Comparison
-        3. Technical Specifications
-        4. Pros and Cons of each car
-        5. Recommendation based on different use cases
-        
-        Format the response in a clear, structured way with bullet points and clear sections.
-        """
-        
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, call_type='comparison_text', language='English')
         return response.text
     except Exception as e:
         raise Exception(f"Error comparing cars: {str(e)}")
 
 def get_car_specs(brand: str, model: str, year: int, text_model):
     try:
-        prompt = f"""
-        Please provide detailed specifications for a {year} {brand} {model}.
-        Include:
-        1. Brand
-        2. Model
-        3. Year
-        4. Fuel consumption (liters/100km)
-        5. Engine size (cc)
-        6. Number of cylinders
-        7. Transmission type
-        8. Fuel type
-        9. Horsepower
-        10. Torque (Nm)
-        11. Top speed (km/h)
-        12. Acceleration 0-100 km/h (seconds)
-        13. Price range (USD)
-        14. Safety features
-        15. Comfort features
-        16. Technology features
-        
-        Format the response as a JSON object.
-        """
+        prompt = get_prompt('specs_flat', 'English').render(year=year, brand=brand, model=model)
         
-        response = text_model.generate_content(prompt)
+        response = text_model.generate_content(prompt, call_type='specs_flat', language='English')
         
         if not response or not response.text:
             raise Exception("Received empty response from Gemini")
@@ -66,7 +32,7 @@ def get_car_specs(brand: str, model: str, year: int, text_model):
         cleaned_text = cleaned_text.strip()
         
         # Parse the response as JSON
-        specs = json.loads(cleaned_text)
+        specs = load_json(response, cleaned_text)
         return specs
     except Exception as e:
         raise Exception(f"Error getting car specs: {e}") 
\ No newline at end of file
@@ -1,21 +1,13 @@
 import streamlit as st
-import google.generativeai as genai
-import json
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from src.gemini_client import get_session_api_key, get_model
+from src.llm_ledger import load_json
+from src.prompts import get_prompt
 
 def configure_gemini():
     """
-    Configure Gemini API with the current API key
+    Get the Gemini model bound to the current session's API key
     """
-    api_key = st.session_state.get('api_key', os.getenv('GEMINI_API_KEY', ''))
-    if api_key:
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel('models/gemini-2.0-flash-001')
-    return None
+    return get_model(get_session_api_key())
 
 def get_car_models(brand):
     """
@@ -27,28 +19,16 @@ def get_car_models(brand):
             st.error("يرجى إدخال مفتاح Gemini API في الصفحة الرئيسية أولاً.")
             return []
 
-        prompt = f"""قم بإرجاع جميع موديلات سيارات {brand} بتنسيق JSON:
-        {{
-            "models": [
-                {{
-                    "name": "اسم الموديل",
-                    "years": ["سنوات الإنتاج"],
-                    "type": "نوع السيارة"
-                }}
-            ]
-        }}
-        
-        يجب أن تكون جميع الإجابات باللغة العربية.
-        قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
+        prompt = get_prompt('model_list', 'Arabic').render(brand=brand)
         
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, call_type='model_list', language='Arabic')
         response_text = response.text.strip()
         
         # Clean the response
         response_text = response_text.replace('```json', '').replace('```', '').strip()
         
         # Parse the response
-        data = json.loads(response_text)
+        data = load_json(response, response_text)
         return data['models']
         
     except Exception as e:
@@ -86,27 +66,16 @@ def get_car_brands():
             st.error("يرجى إدخال مفتاح Gemini API في الصفحة الرئيسية أولاً.")
             return []
 
-        prompt = """قم بإرجاع قائمة بجميع شركات تصنيع السيارات المعروفة بتنسيق JSON:
-        {
-            "brands": [
-                {
-                    "name": "اسم الشركة",
-                    "country": "بلد المنشأ"
-                }
-            ]
-        }
+        prompt = get_prompt('brand_list', 'Arabic').render()
         
-        يجب أن تكون جميع الإجابات باللغة العربية.
-        قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
-        
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, call_type='brand_list', language='Arabic')
         response_text = response.text.strip()
         
         # Clean the response
         response_text = response_text.replace('```json', '').replace('```', '').strip()
         
         # Parse the response
-        data = json.loads(response_text)
+        data = load_json(response, response_text)
         return data['brands']
         
     except Exception as e:
@@ -123,36 +92,16 @@ def get_car_data_from_brand(brand):
             st.error("يرجى إدخال مفتاح Gemini API في الصفحة الرئيسية أولاً.")
             return None
 
-        prompt = f"""قم بإرجاع معلومات تفصيلية عن سيارات {brand} بتنسيق JSON:
-        {{
-            "brand_info": {{
-                "name": "اسم الشركة",
-                "country": "بلد المنشأ",
-                "founded_year": "سنة التأسيس",
-                "description": "وصف مختصر عن الشركة"
-            }},
-            "popular_models": [
-                {{
-                    "name": "اسم الموديل",
-                    "years": ["سنوات الإنتاج"],
-                    "type": "نوع السيارة",
-                    "description": "وصف مختصر للموديل"
-                }}
-            ],
-            "car_types": ["أنواع السيارات التي تنتجها الشركة"]
-        }}
-        
-        يجب أن تكون جميع الإجابات باللغة العربية.
-        قم بإرجاع كائن JSON فقط، بدون أي نص إضافي قبل أو بعد الكائن."""
+        prompt = get_prompt('brand_info', 'Arabic').render(brand=brand)
         
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, call_type='brand_info', language='Arabic')
         response_text = response.text.strip()
         
         # Clean the response
         response_text = response_text.replace('```json', '').replace('```', '').strip()
         
         # Parse the response
-        data = json.loads(response_text)
+        data = load_json(response, response_text)
         return data
         
     except Exception as e:
@@ -1,8 +1,9 @@
-import google.generativeai as genai
 from PIL import Image
 import io
 import re
 import json
+from src.llm_ledger import load_json
+from src.prompts import get_prompt
 
 def detect_car(image, vision_model):
     try:
@@ -16,22 +17,46 @@ def detect_car(image, vision_model):
         img_byte_arr = img_byte_arr.getvalue()
         
         # Prepare the prompt
-        prompt = """
-        Analyze this car image and provide the following information in a structured format:
-        Make: [brand]
-        Model: [model]
-        Year: [year]
-        Type: [vehicle type]
-        
-        Be specific about the model and year if possible.
-        """
+        prompt = get_prompt('detection_text', 'English').render()
         
         # Get response from Gemini
-        response = vision_model.generate_content([prompt, Image.open(io.BytesIO(img_byte_arr))])
+        response = vision_model.generate_content([prompt, Image.open(io.BytesIO(img_byte_arr))],
+                                                 call_type='detection_text', language='English')
         return response.text
     except Exception as e:
         raise Exception(f"Error processing image: {str(e)}")
 
+def detect_cars(image_bytes, vision_model, language='Arabic'):
+    """Detect every car in a JPEG image with a single vision call.
+
+    Returns the details (brand/model/year/type) and box of each car, the box
+    being [ymin, xmin, ymax, xmax] scaled to 0-1000. Items without a brand,
+    model or box are dropped.
+    """
+    response = vision_model.generate_content([
+        get_prompt('detection_multi', language).render(),
+        {"mime_type": "image/jpeg", "data": image_bytes}
+    ], call_type='detection_multi', language=language)
+
+    # Drop any text or code fence around the JSON array (or a lone object)
+    json_match = re.search(r'[\[{].*[\]}]', response.text, re.DOTALL)
+    items = load_json(response, json_match.group(0) if json_match else response.text)
+    if isinstance(items, dict):
+        items = [items]
+
+    cars = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('brand') or not item.get('model'):
+            continue
+        box = item.get('box')
+        if not isinstance(box, list) or len(box) != 4:
+            continue
+        cars.append({
+            'details': {field: item.get(field, '') for field in ('brand', 'model', 'year', 'type')},
+            'box': box
+        })
+    return cars
+
 def extract_car_details(text):
     details = {
         'brand': None,
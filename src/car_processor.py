@@ -1,9 +1,20 @@
+import io
 import json
 import streamlit as st
 from PIL import Image
-import io
 import re
+from src.image_utils import to_jpeg_bytes, crop_box
+from src.llm_ledger import load_json
+from src.profiling import span, profiled
+from src.spec_view import render_specs
+from src.prompts import get_prompt
+from src.car_specs import get_specs, get_canonical_specs, get_canonical_specs_many
+from src.car_detection import detect_cars
+from src.database import save_cars
+from src.gemini_client import get_models
+from src.prefetch import get_prefetched_specs
 
+@profiled('json.clean')
 def clean_json_string(json_str):
     """Clean and fix common JSON formatting issues"""
     # Remove any leading/trailing whitespace and newlines
@@ -30,64 +41,43 @@ def process_car(image, vision_model, text_model, language):
     try:
         # Convert image to bytes if it's not already
         if isinstance(image, Image.Image):
-            img_byte_arr = io.BytesIO()
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            image.save(img_byte_arr, format='JPEG')
-            img_byte_arr = img_byte_arr.getvalue()
+            with span('image.encode'):
+                img_byte_arr = to_jpeg_bytes(image)
         else:
             img_byte_arr = image
 
         # Get language-specific prompts
-        from src.language import get_language_prompts
-        prompts = get_language_prompts(language)
+        prompt_language = "Arabic" if language == "Arabic" else "English"
         
         # Detect car details
         response = vision_model.generate_content([
-            prompts["detection_prompt"],
+            get_prompt("detection", prompt_language).render(),
             {"mime_type": "image/jpeg", "data": img_byte_arr}
-        ])
+        ], call_type='detection', language=language)
         
         # Extract car details from response
         response_text = response.text.strip()
-        st.write("Raw response from vision model:", response_text)  # Debug output
         
         # Clean the response text
         cleaned_text = clean_json_string(response_text)
         
         try:
             # Try to parse the cleaned response
-            car_details = json.loads(cleaned_text)
+            car_details = load_json(response, cleaned_text)
         except json.JSONDecodeError as e:
             st.error(f"Error parsing car details JSON: {str(e)}")
             st.error(f"Cleaned response: {cleaned_text}")
             return None, None
         
         # Validate car details
-        required_fields = ["brand", "model", "year", "type"]
-        if not all(field in car_details for field in required_fields):
+        if not isinstance(car_details, dict) or not all(field in car_details for field in REQUIRED_DETAILS):
             st.error("Missing required fields in car details")
             return None, None
         
         # Get detailed specifications
-        specs_prompt = prompts["specs_prompt"].format(
-            year=car_details["year"],
-            brand=car_details["brand"],
-            model=car_details["model"]
-        )
-        
-        response = text_model.generate_content(specs_prompt)
-        
-        # Extract specifications from response
-        response_text = response.text.strip()
-        st.write("Raw response from text model:", response_text)  # Debug output
-        
-        # Clean the response text
-        cleaned_text = clean_json_string(response_text)
-        
         try:
-            # Try to parse the cleaned response
-            specs = json.loads(cleaned_text)
+            specs = get_specs(car_details["brand"], car_details["model"], car_details["year"],
+                              text_model, language=language)
             
             # Validate specs structure
             required_sections = ["basic_info", "performance", "technical_specs", "features"]
@@ -103,7 +93,7 @@ def process_car(image, vision_model, text_model, language):
                 
         except json.JSONDecodeError as e:
             st.error(f"Error parsing specifications JSON: {str(e)}")
-            st.error(f"Cleaned response: {cleaned_text}")
+            st.error(f"Cleaned response: {e.doc}")
             return car_details, None
         
         return car_details, specs
@@ -116,58 +106,66 @@ def display_specifications(specs, language):
     """Display car specifications"""
     if not specs:
         return
-        
-    # Get language-specific texts
-    from src.language import get_language_texts
-    texts = get_language_texts(language)
-    
-    st.subheader(texts["specs"])
-    
-    # Basic Information
-    st.subheader(texts["basic_info"])
-    basic_info = specs["basic_info"]
-    st.write(f"**Brand:** {basic_info['brand']}")
-    st.write(f"**Model:** {basic_info['model']}")
-    st.write(f"**Year:** {basic_info['year']}")
-    st.write(f"**Type:** {basic_info['type']}")
-    
-    # Performance
-    st.subheader(texts["performance"])
-    performance = specs["performance"]
-    st.write(f"**Fuel Consumption:** {performance['fuel_consumption']}")
-    st.write(f"**Engine Size:** {performance['engine_size']}")
-    st.write(f"**Cylinders:** {performance['cylinders']}")
-    st.write(f"**Transmission:** {performance['transmission']}")
-    st.write(f"**Fuel Type:** {performance['fuel_type']}")
-    st.write(f"**Horsepower:** {performance['horsepower']}")
-    st.write(f"**Torque:** {performance['torque']}")
-    st.write(f"**Top Speed:** {performance['top_speed']}")
-    st.write(f"**Acceleration:** {performance['acceleration']}")
-    
-    # Technical Specifications
-    st.subheader(texts["technical"])
-    tech_specs = specs["technical_specs"]
-    st.write(f"**Length:** {tech_specs['length']}")
-    st.write(f"**Width:** {tech_specs['width']}")
-    st.write(f"**Height:** {tech_specs['height']}")
-    st.write(f"**Wheelbase:** {tech_specs['wheelbase']}")
-    st.write(f"**Weight:** {tech_specs['weight']}")
-    st.write(f"**Seating Capacity:** {tech_specs['seating_capacity']}")
-    st.write(f"**Trunk Capacity:** {tech_specs['trunk_capacity']}")
-    
-    # Features
-    st.subheader(texts["features"])
-    features = specs["features"]
-    st.write(f"**{texts['price']}:** {features['price_range']}")
-    
-    st.write(f"**{texts['safety']}:**")
-    for feature in features["safety_features"]:
-        st.write(f"- {feature}")
-        
-    st.write(f"**{texts['comfort']}:**")
-    for feature in features["comfort_features"]:
-        st.write(f"- {feature}")
-        
-    st.write(f"**{texts['tech']}:**")
-    for feature in features["technology_features"]:
-        st.write(f"- {feature}") 
\ No newline at end of file
+    render_specs(specs, language)
+
+REQUIRED_DETAILS = ["brand", "model", "year", "type"]
+
+def _check_car_details(car_details):
+    # Raised errors are shown to the user as the job's error, and counted as parse failures
+    if not isinstance(car_details, dict):
+        raise ValueError("The car details returned by the model are not a JSON object")
+    missing = [field for field in REQUIRED_DETAILS if field not in car_details]
+    missing += [field for field in ("brand", "model") if field not in missing and not car_details[field]]
+    if missing:
+        raise ValueError(f"Missing required fields in car details: {', '.join(missing)}")
+    return car_details
+
+def detect_car_details(img_byte_arr, vision_model):
+    """Detect the brand, model, year and type of the car in a JPEG image"""
+    response = vision_model.generate_content([
+        get_prompt('detection', 'Arabic').render(),
+        {"mime_type": "image/jpeg", "data": img_byte_arr}
+    ], call_type='detection', language='Arabic')
+    return load_json(response, clean_json_string(response.text), _check_car_details)
+
+def run_detection_job(payload, api_key, img_byte_arr=None):
+    """Detect the car(s) of a detection job, get their canonical specs and save them.
+
+    payload['mode'] is 'image' (one car in the photo), 'multi' (every car,
+    saved as local crops) or 'manual' (payload['details'] as entered).
+    Returns the ids of the saved cars.
+    """
+    vision_model, text_model = get_models(api_key)
+    if text_model is None:
+        raise Exception("No Gemini API key")
+
+    if payload['mode'] == 'manual':
+        car_details = payload['details']
+        # The prefetch started while typing usually has the specs ready
+        specs = get_prefetched_specs(car_details['brand'], car_details['model'], car_details['year'], text_model)
+        # Keep the car exactly as the user entered it
+        specs['basic_info'] = dict(car_details)
+        cars = [(car_details, specs, None)]
+    elif payload['mode'] == 'multi':
+        image = Image.open(io.BytesIO(img_byte_arr))
+        detected = []
+        with span('image.crop'):
+            for car in detect_cars(img_byte_arr, vision_model):
+                try:
+                    detected.append((car['details'], to_jpeg_bytes(crop_box(image, car['box']))))
+                except ValueError as e:
+                    print(f"Skipping detected car: {str(e)}")
+        # Cached cars are reused, the others generated together in one call
+        specs = get_canonical_specs_many(
+            [(details['brand'], details['model'], details['year']) for details, _ in detected], text_model)
+        cars = [(details, car_specs, crop) for (details, crop), car_specs in zip(detected, specs)]
+    else:
+        car_details = detect_car_details(img_byte_arr, vision_model)
+        specs = get_canonical_specs(car_details['brand'], car_details['model'], car_details['year'],
+                                    text_model)
+        cars = [(car_details, specs, img_byte_arr)]
+
+    # Save every car in one transaction
+    car_ids = save_cars({'details': car_details, 'specs': car_specs, 'image': car_image}
+                        for car_details, car_specs, car_image in cars) if cars else []
+    return {'car_ids': car_ids}
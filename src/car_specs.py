@@ -1,69 +1,124 @@
-import json
+import os
+import re
+from src.config import load_env
+from src.language import localize_specs
+from src.llm_ledger import load_json, record_call
+from src.prompts import get_prompt
+from src.rate_limiter import PRIORITY_INTERACTIVE
+from src.response_cache import get_cached, put_cached
+from src.spec_format import expand_specs
+
+load_env()
+
+# 'compact' asks for a positional array expanded locally, 'verbose' for the nested JSON
+SPEC_WIRE_FORMAT = os.getenv('SPEC_WIRE_FORMAT', 'compact')
+
+def _clean_response_text(text):
+    # Strip the markdown code fence the model often wraps JSON in
+    cleaned_text = text.strip()
+    if cleaned_text.startswith('```json'):
+        cleaned_text = cleaned_text[7:]
+    elif cleaned_text.startswith('```'):
+        cleaned_text = cleaned_text[3:]
+    if cleaned_text.endswith('```'):
+        cleaned_text = cleaned_text[:-3]
+    cleaned_text = cleaned_text.strip()
+    
+    # Drop any text around the JSON object or array
+    json_match = re.search(r'[\[{].*[\]}]', cleaned_text, re.DOTALL)
+    if json_match:
+        cleaned_text = json_match.group(0)
+    return cleaned_text
+
+def spec_cache_key(brand, model, year, wire_format=None):
+    """Get the response cache key of a car's canonical specifications"""
+    call_type = 'specs_compact' if (wire_format or SPEC_WIRE_FORMAT) == 'compact' else 'specs'
+    return get_prompt(call_type, 'English').cache_key(year=year, brand=brand, model=model)
+
+def get_canonical_specs(brand, model, year, text_model, wire_format=None, priority=PRIORITY_INTERACTIVE):
+    """Get the language-neutral specifications of a car, generated once and cached"""
+    wire_format = wire_format or SPEC_WIRE_FORMAT
+    call_type = 'specs_compact' if wire_format == 'compact' else 'specs'
+    template = get_prompt(call_type, 'English')
+
+    # Keyed on the prompt version, so changing the prompt regenerates the specs
+    key = spec_cache_key(brand, model, year, wire_format)
+    specs = get_cached(key)
+    if specs is not None:
+        record_call(call_type, text_model.model_name, cache_status='hit')
+        return specs
+
+    prompt = template.render(year=year, brand=brand, model=model)
+    response = text_model.generate_content(prompt, call_type=call_type, priority=priority)
+    if not response or not response.text:
+        raise Exception("Received empty response from Gemini")
+
+    specs = load_json(response, _clean_response_text(response.text), expand_specs)
+    put_cached(key, call_type, specs)
+    return specs
+
+def get_canonical_specs_many(cars, text_model, wire_format=None):
+    """Get the language-neutral specifications of many (brand, model, year) cars, in the order given.
+
+    Repeated and cached cars are looked up once. With the compact wire format
+    the remaining cars are generated in a single call and cached one by one.
+    """
+    wire_format = wire_format or SPEC_WIRE_FORMAT
+    call_type = 'specs_compact' if wire_format == 'compact' else 'specs'
+    template = get_prompt(call_type, 'English')
+
+    keys = [template.cache_key(year=year, brand=brand, model=model) for brand, model, year in cars]
+    specs, missing = {}, {}
+    for key, car in zip(keys, cars):
+        if key in specs or key in missing:
+            continue
+        cached = get_cached(key)
+        if cached is not None:
+            record_call(call_type, text_model.model_name, cache_status='hit')
+            specs[key] = cached
+        else:
+            missing[key] = car
+
+    if len(missing) == 1 or wire_format != 'compact':
+        for key, (brand, model, year) in missing.items():
+            specs[key] = get_canonical_specs(brand, model, year, text_model, wire_format)
+    elif missing:
+        lines = '\n'.join(f"{year} {brand} {model}" for brand, model, year in missing.values())
+        prompt = get_prompt('specs_compact_batch', 'English').render(cars=lines)
+        response = text_model.generate_content(prompt, call_type='specs_compact_batch')
+        if not response or not response.text:
+            raise Exception("Received empty response from Gemini")
+
+        def expand_all(values):
+            if not isinstance(values, list) or len(values) != len(missing):
+                raise ValueError(f"Expected specifications of {len(missing)} cars")
+            return [expand_specs(car_values) for car_values in values]
+
+        # Nothing is cached unless every car's answer is well formed
+        for key, car_specs in zip(missing, load_json(response, _clean_response_text(response.text), expand_all)):
+            specs[key] = car_specs
+            put_cached(key, call_type, car_specs)
+    return [specs[key] for key in keys]
+
+def get_specs(brand, model, year, text_model, language='English', wire_format=None):
+    """Get the specifications (basic_info/performance/technical_specs/features) of a car localized for display"""
+    specs = get_canonical_specs(brand, model, year, text_model, wire_format)
+    return localize_specs(specs, language, text_model)
 
 def get_vehicle_specs(brand: str, model: str, year: int, text_model):
     try:
-        prompt = f"""
-        Please provide detailed specifications for a {year} {brand} {model}.
-        Include:
-        1. Brand
-        2. Model
-        3. Year
-        4. Fuel consumption (liters/100km)
-        5. Engine size (cc)
-        6. Number of cylinders
-        7. Transmission type
-        8. Fuel type
-        9. Horsepower
-        10. Torque (Nm)
-        11. Top speed (km/h)
-        12. Acceleration 0-100 km/h (seconds)
-        13. Price range (USD)
-        14. Safety features
-        15. Comfort features
-        16. Technology features
-        
-        Format the response as a JSON object with this structure:
-        {{
-            "brand": "{brand}",
-            "model": "{model}",
-            "year": {year},
-            "fuel_consumption": float,
-            "engine_size": integer,
-            "cylinders": integer,
-            "transmission": "string",
-            "fuel_type": "string",
-            "horsepower": integer,
-            "torque": integer,
-            "top_speed": integer,
-            "acceleration": float,
-            "price_range": "string",
-            "safety_features": ["string"],
-            "comfort_features": ["string"],
-            "technology_features": ["string"]
-        }}
-        
-        Important:
-        - Return ONLY the JSON object, no additional text
-        - Use exact values for brand, model, and year as provided
-        - Ensure all numeric values are actual numbers, not strings
-        - If any value is unknown, use null
-        """
-        
-        response = text_model.generate_content(prompt)
-        
+        prompt = get_prompt('specs_flat', 'English').render(year=year, brand=brand, model=model)
+
+        response = text_model.generate_content(prompt, call_type='specs_flat', language='English')
+
         if not response or not response.text:
             raise Exception("Received empty response from Gemini")
-        
+
         # Clean the response text
-        cleaned_text = response.text.strip()
-        if cleaned_text.startswith('```json'):
-            cleaned_text = cleaned_text[7:]
-        if cleaned_text.endswith('```'):
-            cleaned_text = cleaned_text[:-3]
-        cleaned_text = cleaned_text.strip()
-        
+        cleaned_text = _clean_response_text(response.text)
+
         # Parse the response as JSON
-        specs = json.loads(cleaned_text)
+        specs = load_json(response, cleaned_text)
         return specs
     except Exception as e:
-        raise Exception(f"Error getting vehicle specs: {e}") 
\ No newline at end of file
+        raise Exception(f"Error getting vehicle specs: {e}")
@@ -1,44 +1,42 @@
 import os
+import threading
 from dotenv import load_dotenv
-import google.generativeai as genai
 import streamlit as st
 
+_env_lock = threading.Lock()
+_env_loaded = False
+
+def load_env():
+    """Load the .env file once per process"""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
 def initialize_models():
     """Initialize Gemini models"""
+    from src.gemini_client import get_models
+
     # Load environment variables
-    load_dotenv()
-    
-    # Configure Gemini API
-    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-    
-    # Initialize models
-    vision_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-    text_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-    
-    return vision_model, text_model
+    load_env()
+
+    # Get the models bound to the configured API key
+    return get_models(os.getenv('GEMINI_API_KEY'))
 
 def load_config():
     """Load application configuration"""
-    # Load environment variables
-    load_dotenv()
-    
-    # Configure Gemini API
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    # Load environment variables and get the (cached) models
+    vision_model, text_model = initialize_models()
+    if not vision_model:
         st.error("Please set your GEMINI_API_KEY in the .env file")
         st.stop()
-    
-    genai.configure(api_key=api_key)
-    
-    # Initialize models
-    vision_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-    text_model = genai.GenerativeModel('models/gemini-2.0-flash-001')
-    
+
     # Set page configuration
     st.set_page_config(
         page_title="Car Type Detector",
         page_icon="🚗",
         layout="centered"
     )
-    
-    return vision_model, text_model 
\ No newline at end of file
+
+    return vision_model, text_model
@@ -1,73 +1,521 @@
+import os
+import re
+import queue
 import sqlite3
 import json
-import base64
-from io import BytesIO
-from PIL import Image
-import io
+import time
+import threading
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.config import load_env
+from src.image_store import image_path, put_image, read_image, delete_image
+from src.image_utils import to_jpeg_bytes
+from src.profiling import profiled
+
+load_env()
+
+DB_PATH = 'cars.db'
+
+# Cars per page of the compare page gallery
+PAGE_SIZE = int(os.getenv('CAR_GALLERY_PAGE_SIZE', '12'))
+
+# Cars inserted per transaction by save_cars, and threads encoding their images
+SAVE_BATCH_SIZE = int(os.getenv('CAR_SAVE_BATCH_SIZE', '200'))
+ENCODE_WORKERS = int(os.getenv('CAR_ENCODE_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# What makes two saved cars the same one: 'model' (brand, model and year),
+# 'model_image' (the same photo of that model too) or 'none' (never merge)
+IDENTITY = os.getenv('CAR_IDENTITY', 'model')
+
+# Columns copied out of the details JSON so the gallery can filter and page in SQL
+CAR_COLUMNS = ('brand', 'model', 'year', 'type')
+
+# Most queued writes the writer thread groups into one transaction
+WRITE_BATCH = int(os.getenv('CAR_WRITE_BATCH', '64'))
+# Seconds a caller waits for its queued write before giving up on it
+WRITE_TIMEOUT = float(os.getenv('CAR_WRITE_TIMEOUT', '60'))
+
+_init_lock = threading.Lock()
+_initialized = False
+_encoder = None
+_writes = queue.Queue()
+_writer = None
+# Actions of the writer's current transaction, run once it is committed
+_after_commit = []
+
+def get_connection():
+    """Open a connection to the cars database, creating the schema on first use"""
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                init_db()
+                _initialized = True
+    return sqlite3.connect(DB_PATH, timeout=30)
 
 def init_db():
-    conn = sqlite3.connect('cars.db')
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     c = conn.cursor()
+    # Readers keep reading while the writer thread commits
+    c.execute('PRAGMA journal_mode=WAL')
     c.execute('''CREATE TABLE IF NOT EXISTS cars
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   details TEXT,
                   specs TEXT,
                   image BLOB)''')
+    # Images live in the content-addressed store (src/image_store.py), rows only keep the hash
+    if 'image_hash' not in [column[1] for column in c.execute('PRAGMA table_info(cars)')]:
+        c.execute('ALTER TABLE cars ADD COLUMN image_hash TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cars_image_hash ON cars (image_hash)')
+    _migrate_inline_images(conn)
+    existing = [column[1] for column in c.execute('PRAGMA table_info(cars)')]
+    for column, column_type in zip(CAR_COLUMNS, ('TEXT', 'TEXT', 'INTEGER', 'TEXT')):
+        if column not in existing:
+            c.execute(f'ALTER TABLE cars ADD COLUMN {column} {column_type}')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cars_brand ON cars (brand COLLATE NOCASE, year)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cars_type ON cars (type COLLATE NOCASE, year)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cars_year ON cars (year)')
+    _backfill_car_columns(conn)
+    # Saving a car already in the library updates it instead, see save_cars
+    existing = [column[1] for column in c.execute('PRAGMA table_info(cars)')]
+    for column, column_type in (('identity_key', 'TEXT'), ('detections', 'INTEGER DEFAULT 1'),
+                                ('created_at', 'REAL'), ('updated_at', 'REAL')):
+        if column not in existing:
+            c.execute(f'ALTER TABLE cars ADD COLUMN {column} {column_type}')
+    if 'identity_key' not in existing:
+        _backfill_identity_keys(conn)
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_cars_identity_key ON cars (identity_key)')
+    # Token buckets shared between processes by the Gemini rate limiter
+    c.execute('''CREATE TABLE IF NOT EXISTS rate_limits
+                 (key_id TEXT PRIMARY KEY,
+                  tokens REAL,
+                  updated_at REAL)''')
+    # One row per Gemini call, see src/llm_ledger.py
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_calls
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  created_at REAL,
+                  call_type TEXT,
+                  model TEXT,
+                  language TEXT,
+                  prompt_chars INTEGER,
+                  prompt_bytes INTEGER,
+                  response_chars INTEGER,
+                  prompt_tokens INTEGER,
+                  response_tokens INTEGER,
+                  total_tokens INTEGER,
+                  latency_ms REAL,
+                  queue_wait_ms REAL,
+                  cache_status TEXT,
+                  parse_status TEXT,
+                  error TEXT)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls (created_at)')
+    # Generated by the caller, so a parse outcome can be attached without waiting for the insert
+    if 'call_key' not in [column[1] for column in c.execute('PRAGMA table_info(llm_calls)')]:
+        c.execute('ALTER TABLE llm_calls ADD COLUMN call_key TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_llm_calls_call_key ON llm_calls (call_key)')
+    # Parsed model answers keyed by prompt version and inputs, see src/response_cache.py
+    c.execute('''CREATE TABLE IF NOT EXISTS response_cache
+                 (key TEXT PRIMARY KEY,
+                  call_type TEXT,
+                  value TEXT,
+                  created_at REAL,
+                  hits INTEGER DEFAULT 0)''')
+    # Translations of free-text spec items, see src/translation.py
+    c.execute('''CREATE TABLE IF NOT EXISTS translations
+                 (source TEXT,
+                  language TEXT,
+                  text TEXT,
+                  PRIMARY KEY (source, language))''')
+    # Background jobs that outlive Streamlit reruns, see src/jobs.py
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs
+                 (id TEXT PRIMARY KEY,
+                  kind TEXT,
+                  dedupe_key TEXT,
+                  payload TEXT,
+                  status TEXT,
+                  result TEXT,
+                  error TEXT,
+                  created_at REAL,
+                  updated_at REAL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs (dedupe_key, status)')
+    # The process running a job marks it alive, so other processes only recover dead ones
+    existing = [column[1] for column in c.execute('PRAGMA table_info(jobs)')]
+    for column, column_type in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+        if column not in existing:
+            c.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+    # Image embeddings of the similarity index, see src/image_index.py
+    c.execute('''CREATE TABLE IF NOT EXISTS image_embeddings
+                 (image_hash TEXT PRIMARY KEY,
+                  version INTEGER,
+                  vector BLOB)''')
     conn.commit()
     conn.close()
 
-def save_car(car_data):
-    """Save car data to the database"""
-    try:
-        # Convert image to bytes if it exists
-        image_bytes = None
-        if car_data.get('image'):
-            if car_data['image'].mode == 'RGBA':
-                car_data['image'] = car_data['image'].convert('RGB')
-            img_byte_arr = BytesIO()
-            car_data['image'].save(img_byte_arr, format='JPEG')
-            image_bytes = img_byte_arr.getvalue()
-        
-        # Save to database
-        conn = sqlite3.connect('cars.db')
-        c = conn.cursor()
-        
-        # Convert details and specs to JSON strings
-        details_json = json.dumps(car_data['details'])
-        specs_json = json.dumps(car_data['specs'])
-        
-        c.execute('''INSERT INTO cars (details, specs, image)
-                    VALUES (?, ?, ?)''', (details_json, specs_json, image_bytes))
+def _migrate_inline_images(conn):
+    # Move images saved inline before the image store into it, a few rows at a time
+    c = conn.cursor()
+    while True:
+        c.execute('SELECT id, image FROM cars WHERE image IS NOT NULL LIMIT 100')
+        rows = c.fetchall()
+        if not rows:
+            break
+        c.executemany('UPDATE cars SET image_hash = ?, image = NULL WHERE id = ?',
+                      [(put_image(image), car_id) for car_id, image in rows])
         conn.commit()
-        conn.close()
-        
-        return True
-    except Exception as e:
-        print(f"Error saving car: {str(e)}")
-        return False
 
+def _parse_year(value):
+    # Years come from the model or the user, e.g. 2020, "2020", "٢٠٢٠" or "2019-2021"
+    match = re.search(r'\d{4}', str(value or ''))
+    return int(match.group(0)) if match else None
+
+def car_columns(details):
+    """Get the (brand, model, year, type) columns of a car from its details"""
+    return (str(details.get('brand') or '').strip() or None,
+            str(details.get('model') or '').strip() or None,
+            _parse_year(details.get('year')),
+            str(details.get('type') or '').strip() or None)
+
+def _backfill_car_columns(conn):
+    # Fill the filter columns of cars saved before they existed
+    c = conn.cursor()
+    c.execute('SELECT id, details FROM cars WHERE brand IS NULL AND details IS NOT NULL')
+    rows = [(*car_columns(json.loads(details)), car_id) for car_id, details in c.fetchall()]
+    if rows:
+        c.executemany('UPDATE cars SET brand = ?, model = ?, year = ?, type = ? WHERE id = ?', rows)
+        conn.commit()
+
+def identity_key(details, image_hash=None, identity=None):
+    """Get the key identifying a car in the library, or None if it cannot be identified"""
+    identity = identity or IDENTITY
+    brand, model, year, _ = car_columns(details)
+    if identity == 'none' or not brand or not model:
+        return None
+    key = '|'.join((' '.join(brand.lower().split()), ' '.join(model.lower().split()), str(year or '')))
+    if identity == 'model_image':
+        key += f"|{image_hash or ''}"
+    return key
+
+def _backfill_identity_keys(conn):
+    # Existing duplicates are kept; only the newest row of each identity gets the key
+    c = conn.cursor()
+    c.execute('SELECT id, details, image_hash FROM cars ORDER BY id DESC')
+    keys = {}
+    for car_id, details, image_hash in c.fetchall():
+        key = identity_key(json.loads(details), image_hash) if details else None
+        if key and key not in keys:
+            keys[key] = car_id
+    c.executemany('UPDATE cars SET identity_key = ? WHERE id = ?', keys.items())
+    conn.commit()
+
+def _merge_patch(specs):
+    # Leave out empty values, so a newer answer only overrides what it actually knows
+    if isinstance(specs, dict):
+        merged = {key: _merge_patch(value) for key, value in specs.items()}
+        return {key: value for key, value in merged.items() if value not in (None, '', [], {})}
+    return specs
+
+_listeners = []
+
+def add_change_listener(listener):
+    """Call listener(event, car_ids) after cars are saved ('save') or deleted ('delete')"""
+    _listeners.append(listener)
+
+def notify_change(event, car_ids):
+    """Tell the change listeners that cars were saved, updated or deleted"""
+    for listener in _listeners:
+        try:
+            listener(event, car_ids)
+        except Exception as e:
+            print(f"Error in car change listener: {str(e)}")
+
+def _write_loop():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.isolation_level = None
+    c = conn.cursor()
+    while True:
+        # Group whatever is queued into one transaction, each write in its own savepoint
+        batch = [_writes.get()]
+        while len(batch) < WRITE_BATCH:
+            try:
+                batch.append(_writes.get_nowait())
+            except queue.Empty:
+                break
+        outcomes = []
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            for future, write, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                c.execute('SAVEPOINT write')
+                actions = len(_after_commit)
+                try:
+                    outcomes.append((future, write(c, *args), None))
+                    c.execute('RELEASE write')
+                except Exception as e:
+                    c.execute('ROLLBACK TO write')
+                    c.execute('RELEASE write')
+                    del _after_commit[actions:]
+                    outcomes.append((future, None, e))
+            c.execute('COMMIT')
+            # Before the next batch, whose writes then see both the rows and the files as committed
+            for action, action_args in _after_commit:
+                try:
+                    action(*action_args)
+                except Exception as e:
+                    print(f"Error after committing writes: {str(e)}")
+        except Exception as e:
+            print(f"Error committing writes: {str(e)}")
+            try:
+                if conn.in_transaction:
+                    c.execute('ROLLBACK')
+            except sqlite3.Error:
+                # The writer must outlive a broken transaction
+                pass
+            # Nothing of the batch was committed, including writes that never started
+            outcomes = [(future, None, e) for future, _, _ in batch if not future.done()]
+        _after_commit.clear()
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+def after_commit(action, *args):
+    """Run action(*args) on the writer thread once the current write is committed.
+
+    Only call it from inside a write; nothing runs if the write is rolled back.
+    Files whose rows are written in SQL (e.g. stored images) are removed this
+    way, so no other write can reference them in between.
+    """
+    _after_commit.append((action, args))
+
+def submit_write(write, *args):
+    """Queue write(cursor, *args) for the single writer thread and return a Future of its result.
+
+    Queued writes are committed together in one transaction; a write that
+    raises is rolled back alone and its Future gets the exception. When the
+    transaction itself fails (e.g. another process holds the database lock
+    past the busy timeout) every write of it fails. Callers wait with
+    .result(timeout=WRITE_TIMEOUT); a write must never wait on another one.
+    """
+    global _writer
+    if not _initialized:
+        # The writer's connection expects the schema
+        get_connection().close()
+    if _writer is None:
+        with _init_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name='db-writer', daemon=True)
+                _writer.start()
+    future = Future()
+    _writes.put((future, write, args))
+    return future
+
+def flush_writes():
+    """Wait until every write queued so far is committed (or failed)"""
+    submit_write(lambda c: None).result(timeout=WRITE_TIMEOUT)
+
+def _store_image(image):
+    # Encode (unless already JPEG bytes) and store one image, returning its (hash, bytes)
+    if not image:
+        return None, None
+    data = image if isinstance(image, bytes) else to_jpeg_bytes(image)
+    return put_image(data), data
+
+def _get_encoder():
+    global _encoder
+    with _init_lock:
+        if _encoder is None:
+            _encoder = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix='image-encode')
+    return _encoder
+
+def _write_cars(c, rows, patches, images, identity):
+    # Insert (or upsert) one batch of cars in the writer's transaction, returning their ids
+    for image_hash, data in images:
+        # A delete committed since the image was stored may have removed the shared file
+        if data and not os.path.exists(image_path(image_hash)):
+            put_image(data)
+    if identity == 'none':
+        # The write lock makes the AUTOINCREMENT ids of the batch contiguous
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cars'")
+        row = c.fetchone()
+        first_id = (row[0] if row else 0) + 1
+        c.executemany('''INSERT INTO cars (details, specs, image_hash, brand, model, year, type,
+                                           identity_key, created_at, updated_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        return list(range(first_id, first_id + len(rows)))
+
+    # RETURNING gives the id of the inserted or updated row, which executemany cannot
+    ids = []
+    replaced = set()
+    for row, patch in zip(rows, patches):
+        image_hash, key = row[2], row[7]
+        if image_hash and key:
+            # A new photo of a saved car replaces its old one
+            c.execute('SELECT image_hash FROM cars WHERE identity_key = ?', (key,))
+            old = c.fetchone()
+            if old and old[0] and old[0] != image_hash:
+                replaced.add(old[0])
+        c.execute('''INSERT INTO cars (details, specs, image_hash, brand, model, year, type,
+                                       identity_key, created_at, updated_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (identity_key) DO UPDATE SET
+                         details = excluded.details,
+                         specs = json_patch(cars.specs, ?),
+                         image_hash = COALESCE(excluded.image_hash, cars.image_hash),
+                         type = COALESCE(excluded.type, cars.type),
+                         detections = cars.detections + 1,
+                         updated_at = excluded.updated_at
+                     RETURNING id''', (*row, patch))
+        ids.append(c.fetchone()[0])
+    _forget_unused_images(c, replaced)
+    return ids
+
+@profiled('db.save_cars')
+def save_cars(cars, batch_size=None, identity=None):
+    """Save many cars and return their ids, in the order given.
+
+    A car with the identity of a saved one (see identity_key) updates it:
+    its details and image are replaced, its specs merged over the old ones
+    and its detection counter incremented. Images are encoded and stored in
+    parallel, and each batch is written by the writer thread in one
+    transaction. Raises when a batch cannot be written.
+    """
+    batch_size = batch_size or SAVE_BATCH_SIZE
+    identity = identity or IDENTITY
+    cars = iter(cars)
+    ids = []
+    while True:
+        batch = list(islice(cars, batch_size))
+        if not batch:
+            break
+        images = [car_data.get('image') for car_data in batch]
+        if sum(1 for image in images if image) > 1:
+            images = list(_get_encoder().map(_store_image, images))
+        else:
+            images = [_store_image(image) for image in images]
+        now = time.time()
+        rows = [(json.dumps(car_data['details']), json.dumps(car_data['specs']), image_hash,
+                 *car_columns(car_data['details']),
+                 identity_key(car_data['details'], image_hash, identity), now, now)
+                for car_data, (image_hash, _) in zip(batch, images)]
+        patches = [json.dumps(_merge_patch(car_data['specs'])) for car_data in batch]
+        ids.extend(submit_write(_write_cars, rows, patches, images, identity).result(timeout=WRITE_TIMEOUT))
+    notify_change('save', ids)
+    return ids
+
+@profiled('db.save_car')
+def save_car(car_data):
+    """Save car data to the database and return its id, raising when it cannot be saved"""
+    return save_cars([car_data])[0]
+
+def _car_from_row(row):
+    # Row of (id, details, specs, image_hash)
+    return {
+        'id': row[0],
+        'details': json.loads(row[1]),
+        'specs': json.loads(row[2]),
+        'image': read_image(row[3])
+    }
+
+@profiled('db.get_all_cars')
 def get_all_cars():
-    conn = sqlite3.connect('cars.db')
+    """Get every saved car, with its image as encoded bytes (st.image takes them as they are)"""
+    conn = get_connection()
     c = conn.cursor()
-    c.execute('SELECT * FROM cars')
-    cars = []
-    for row in c.fetchall():
-        car = {
-            'id': row[0],
-            'details': json.loads(row[1]),
-            'specs': json.loads(row[2]),
-            'image': Image.open(BytesIO(row[3])) if row[3] else None
-        }
-        cars.append(car)
+    c.execute('SELECT id, details, specs, image_hash FROM cars')
+    cars = [_car_from_row(row) for row in c.fetchall()]
     conn.close()
     return cars
 
-def delete_car(car_id):
-    conn = sqlite3.connect('cars.db')
+def _filter_clause(brand=None, car_type=None, year_min=None, year_max=None):
+    conditions = []
+    params = []
+    if brand:
+        conditions.append('brand = ? COLLATE NOCASE')
+        params.append(brand)
+    if car_type:
+        conditions.append('type = ? COLLATE NOCASE')
+        params.append(car_type)
+    if year_min is not None:
+        conditions.append('year >= ?')
+        params.append(year_min)
+    if year_max is not None:
+        conditions.append('year <= ?')
+        params.append(year_max)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+@profiled('db.query_cars')
+def query_cars(brand=None, car_type=None, year_min=None, year_max=None, limit=PAGE_SIZE, offset=0):
+    """Get one page of saved cars matching the filters, with images as encoded bytes"""
+    where, params = _filter_clause(brand, car_type, year_min, year_max)
+    conn = get_connection()
     c = conn.cursor()
-    c.execute('DELETE FROM cars WHERE id = ?', (car_id,))
-    conn.commit()
+    c.execute(f'SELECT id, details, specs, image_hash FROM cars{where} ORDER BY id LIMIT ? OFFSET ?',
+              (*params, limit, offset))
+    cars = [_car_from_row(row) for row in c.fetchall()]
     conn.close()
+    return cars
+
+def get_car(car_id):
+    """Get one saved car by id, or None if it does not exist"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, details, specs, image_hash FROM cars WHERE id = ?', (car_id,))
+    row = c.fetchone()
+    conn.close()
+    return _car_from_row(row) if row else None
+
+def count_cars(brand=None, car_type=None, year_min=None, year_max=None):
+    """Count the saved cars matching the filters"""
+    where, params = _filter_clause(brand, car_type, year_min, year_max)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'SELECT COUNT(*) FROM cars{where}', params)
+    count = c.fetchone()[0]
+    conn.close()
+    return count
 
-# Initialize database when module is imported
-init_db() 
\ No newline at end of file
+def get_filter_options():
+    """Get the brands, types and year range of the saved cars"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT DISTINCT brand FROM cars WHERE brand IS NOT NULL ORDER BY brand COLLATE NOCASE')
+    brands = [row[0] for row in c.fetchall()]
+    c.execute('SELECT DISTINCT type FROM cars WHERE type IS NOT NULL ORDER BY type COLLATE NOCASE')
+    types = [row[0] for row in c.fetchall()]
+    c.execute('SELECT MIN(year), MAX(year) FROM cars')
+    year_range = c.fetchone()
+    conn.close()
+    return {'brands': brands, 'types': types, 'years': year_range}
+
+def _forget_unused_images(c, image_hashes):
+    # Remove the embeddings, and after the commit the files, of images no car uses anymore
+    for image_hash in image_hashes:
+        c.execute('SELECT 1 FROM cars WHERE image_hash = ? LIMIT 1', (image_hash,))
+        if not c.fetchone():
+            c.execute('DELETE FROM image_embeddings WHERE image_hash = ?', (image_hash,))
+            after_commit(delete_image, image_hash)
+
+def _delete_cars(c, car_ids):
+    # Delete cars in the writer's transaction, and their images once no other car uses them
+    placeholders = ', '.join('?' for _ in car_ids)
+    c.execute(f'SELECT DISTINCT image_hash FROM cars WHERE id IN ({placeholders}) AND image_hash IS NOT NULL',
+              car_ids)
+    image_hashes = [row[0] for row in c.fetchall()]
+    c.execute(f'DELETE FROM cars WHERE id IN ({placeholders})', car_ids)
+    _forget_unused_images(c, image_hashes)
+
+@profiled('db.delete_cars')
+def delete_cars(car_ids):
+    """Delete many cars in one transaction, with the images no other car uses"""
+    car_ids = list(car_ids)
+    if not car_ids:
+        return
+    submit_write(_delete_cars, car_ids).result(timeout=WRITE_TIMEOUT)
+    notify_change('delete', car_ids)
+
+@profiled('db.delete_car')
+def delete_car(car_id):
+    submit_write(_delete_cars, [car_id]).result(timeout=WRITE_TIMEOUT)
+    notify_change('delete', [car_id])
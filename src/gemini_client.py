@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+import streamlit as st
+from src.rate_limiter import acquire, penalize, PRIORITY_INTERACTIVE
+from src.llm_ledger import record_call, track_response
+from src.profiling import span
+
+MODEL_NAME = 'models/gemini-2.0-flash-001'
+
+# Times a request is re-queued after the API answers 429
+MAX_RETRIES = 2
+
+# Process-wide registry, shared by every Streamlit session
+_lock = threading.Lock()
+_clients = {}
+_models = {}
+
+class ModelHandle:
+    """Thread-safe model handle whose calls go through the per-key rate limiter"""
+
+    def __init__(self, api_key, model):
+        self._api_key = api_key
+        self._model = model
+        self.model_name = model.model_name
+
+    def generate_content(self, contents, call_type='generic', language=None,
+                         priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Generate content once a request slot is free for this key.
+
+        Every call is recorded in the LLM ledger under `call_type`.
+        """
+        from google.api_core import exceptions as api_exceptions
+
+        with span(f'llm.{call_type}', model=self.model_name, language=language) as info:
+            queue_wait = 0.0
+            start = None
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    queue_wait += acquire(self._api_key, priority)
+                    start = time.monotonic()
+                    try:
+                        response = self._model.generate_content(contents, **kwargs)
+                        break
+                    except api_exceptions.ResourceExhausted:
+                        if attempt == MAX_RETRIES:
+                            raise
+                        penalize(self._api_key)
+            except Exception as e:
+                record_call(call_type, self.model_name, contents, language=language,
+                            latency=time.monotonic() - start if start else None,
+                            queue_wait=queue_wait, error=str(e))
+                raise
+
+            latency = time.monotonic() - start
+            try:
+                response_text = response.text
+            except Exception:
+                # Blocked or empty responses have no text
+                response_text = None
+            info['queue_wait_ms'] = round(queue_wait * 1000, 2)
+            info['response'] = response_text
+            call_key = record_call(call_type, self.model_name, contents, response, response_text,
+                                   language=language, latency=latency, queue_wait=queue_wait)
+            track_response(response, call_key)
+            return response
+
+    def count_tokens(self, contents):
+        """Count the input tokens of a prompt"""
+        return self._model.count_tokens(contents)
+
+def get_session_api_key():
+    """Get the Gemini API key for the current session"""
+    return st.session_state.get('api_key', os.getenv('GEMINI_API_KEY', ''))
+
+def get_client(api_key):
+    """Get the generative service client bound to an API key.
+
+    Each key gets its own client manager, so the global `genai.configure`
+    state is never touched and sessions with different keys can't race.
+    """
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # Imported here, the SDK is the slowest import of a cold start
+            from google.generativeai import client as genai_client
+
+            manager = genai_client._ClientManager()
+            manager.configure(api_key=api_key)
+            client = manager.get_default_client('generative')
+            _clients[api_key] = client
+        return client
+
+def get_model(api_key, model_name=MODEL_NAME):
+    """Get a cached model handle bound to an API key, or None without a key"""
+    if not api_key:
+        return None
+    client = get_client(api_key)
+    with _lock:
+        model = _models.get((api_key, model_name))
+        if model is None:
+            import google.generativeai as genai
+
+            model = genai.GenerativeModel(model_name)
+            # Bind the per-key client instead of the global default one
+            model._client = client
+            model = ModelHandle(api_key, model)
+            _models[(api_key, model_name)] = model
+        return model
+
+def get_models(api_key):
+    """Get the (vision_model, text_model) pair for an API key"""
+    model = get_model(api_key)
+    return model, model
+
+def forget_api_key(api_key):
+    """Drop the cached client and models for an API key"""
+    with _lock:
+        _clients.pop(api_key, None)
+        for key in [key for key in _models if key[0] == api_key]:
+            del _models[key]
@@ -0,0 +1,177 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from src.config import load_env
+from src.database import WRITE_TIMEOUT, get_connection, add_change_listener, submit_write
+from src.image_store import read_image
+
+load_env()
+
+# Cosine similarity from which a saved car is offered as a match for an upload. The same
+# photo re-encoded or resized scores above it; screenshots of one style, or frames of
+# one animation, score 0.65 - 0.97
+MIN_SCORE = float(os.getenv('CAR_SIMILAR_MIN_SCORE', '0.97'))
+
+# Bump when image_embedding changes, so stored vectors are recomputed
+EMBEDDING_VERSION = 2
+# Colour (12 x 3 x 3) and gradient (4 x 4 x 8) histogram bins, then a 12 x 12 colour thumbnail
+EMBEDDING_SIZE = 108 + 128 + 432
+
+_lock = threading.Lock()
+# Row i of _vectors is the embedding of the car _ids[i]; None until first loaded
+_ids = None
+_vectors = None
+# Cars saved or deleted since the index was last refreshed
+_pending = set()
+# Computes the embeddings of saved cars off the page thread, one car batch at a time
+_embedder = None
+_backfilled = False
+
+def image_embedding(image):
+    """Compute a unit-length colour and gradient histogram vector of a PIL image"""
+    small = image.convert('RGB').resize((64, 64), Image.BILINEAR)
+
+    # Hue, saturation and value histogram (12 x 3 x 3 bins)
+    hsv = np.asarray(small.convert('HSV'), dtype=np.int32)
+    bins = hsv[..., 0] * 12 // 256 * 9 + hsv[..., 1] * 3 // 256 * 3 + hsv[..., 2] * 3 // 256
+    color = np.bincount(bins.ravel(), minlength=108).astype(np.float32)
+
+    # Gradient orientation histogram (8 bins) on a 4 x 4 grid, weighted by magnitude
+    gray = np.asarray(small.convert('L'), dtype=np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = ((np.arctan2(gy, gx) + np.pi) * 8 / (2 * np.pi)).astype(np.int32) % 8
+    cells = (np.arange(64)[:, None] // 16) * 4 + np.arange(64)[None, :] // 16
+    gradient = np.bincount((cells * 8 + orientation).ravel(), weights=magnitude.ravel(),
+                           minlength=128).astype(np.float32)
+
+    # Square roots make the cosine of two histograms their Hellinger affinity
+    parts = [np.sqrt(part / max(part.sum(), 1e-6)) for part in (color, gradient)]
+    histograms = np.concatenate(parts)
+    histograms /= max(float(np.linalg.norm(histograms)), 1e-6)
+
+    # Histograms alone match any image of the same style; the centred thumbnail
+    # keeps where the colours are, so unrelated layouts score near zero
+    layout = np.asarray(small.resize((12, 12), Image.BILINEAR), dtype=np.float32).ravel()
+    layout -= layout.mean()
+    layout /= max(float(np.linalg.norm(layout)), 1e-6)
+    return (np.concatenate([histograms, layout]) / np.sqrt(2)).astype(np.float32)
+
+def _put_vectors(c, rows):
+    c.executemany('INSERT OR REPLACE INTO image_embeddings (image_hash, version, vector) VALUES (?, ?, ?)', rows)
+
+def _embed_cars(car_ids=None):
+    # Compute and store the missing embeddings of saved cars (all of them when car_ids is None)
+    query = '''SELECT DISTINCT cars.image_hash FROM cars
+               LEFT JOIN image_embeddings ON image_embeddings.image_hash = cars.image_hash
+               AND image_embeddings.version = ?
+               WHERE cars.image_hash IS NOT NULL AND image_embeddings.vector IS NULL'''
+    params = [EMBEDDING_VERSION]
+    if car_ids is not None:
+        query += f" AND cars.id IN ({', '.join('?' for _ in car_ids)})"
+        params.extend(car_ids)
+    conn = get_connection()
+    try:
+        image_hashes = [row[0] for row in conn.execute(query, params).fetchall()]
+    finally:
+        conn.close()
+
+    rows = []
+    for image_hash in image_hashes:
+        data = read_image(image_hash)
+        if data is None:
+            continue
+        try:
+            vector = image_embedding(Image.open(io.BytesIO(data)))
+        except Exception as e:
+            print(f"Error embedding image {image_hash}: {str(e)}")
+            continue
+        rows.append((image_hash, EMBEDDING_VERSION, vector.tobytes()))
+    if not rows:
+        return
+    submit_write(_put_vectors, rows).result(timeout=WRITE_TIMEOUT)
+
+    # Let the next search load the cars using the new vectors
+    conn = get_connection()
+    try:
+        hashes = [row[0] for row in rows]
+        updated = [row[0] for row in conn.execute(
+            f"SELECT id FROM cars WHERE image_hash IN ({', '.join('?' for _ in hashes)})", hashes)]
+    finally:
+        conn.close()
+    with _lock:
+        _pending.update(updated)
+
+def _submit_embedding(car_ids=None):
+    global _embedder
+    if _embedder is None:
+        _embedder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-embed')
+    _embedder.submit(_embed_cars, car_ids)
+
+def _load_vectors(c, car_ids=None):
+    # Get (car ids, vectors) of cars whose image embedding is stored
+    query = '''SELECT cars.id, image_embeddings.vector FROM cars
+               JOIN image_embeddings ON image_embeddings.image_hash = cars.image_hash
+               AND image_embeddings.version = ?'''
+    params = [EMBEDDING_VERSION]
+    if car_ids is not None:
+        query += f" WHERE cars.id IN ({', '.join('?' for _ in car_ids)})"
+        params.extend(car_ids)
+    c.execute(query, params)
+    rows = c.fetchall()
+    ids = np.array([car_id for car_id, _ in rows], dtype=np.int64)
+    vectors = np.frombuffer(b''.join(blob for _, blob in rows), dtype=np.float32)
+    return ids, vectors.reshape(len(rows), EMBEDDING_SIZE)
+
+def _refresh():
+    # Load the stored vectors on first use, then apply the saves and deletes since the last search
+    global _ids, _vectors, _backfilled
+    if not _backfilled:
+        # Cars saved before this version, or by another process, are embedded in the background
+        _submit_embedding()
+        _backfilled = True
+    if _ids is not None and not _pending:
+        return
+    conn = get_connection()
+    try:
+        if _ids is None:
+            _pending.clear()
+            _ids, _vectors = _load_vectors(conn.cursor())
+        else:
+            changed = sorted(_pending)
+            _pending.clear()
+            ids, vectors = _load_vectors(conn.cursor(), changed)
+            keep = ~np.isin(_ids, changed)
+            _ids = np.concatenate([_ids[keep], ids])
+            _vectors = np.concatenate([_vectors[keep], vectors])
+    finally:
+        conn.close()
+
+def find_similar(image, k=3, min_score=None):
+    """Get the (car id, cosine similarity) of the saved cars whose photos look most like an image"""
+    min_score = MIN_SCORE if min_score is None else min_score
+    query = image_embedding(image)
+    with _lock:
+        _refresh()
+        ids, vectors = _ids, _vectors
+    if not len(ids):
+        return []
+    scores = vectors @ query
+    top = np.argpartition(-scores, min(k, len(ids)) - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(ids[i]), float(scores[i])) for i in top if scores[i] >= min_score]
+
+def _on_change(event, car_ids):
+    with _lock:
+        _pending.update(car_ids)
+        if event == 'save':
+            _submit_embedding(car_ids)
+
+# Saved cars are embedded right away in the background; searches only load stored vectors
+add_change_listener(_on_change)
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+from PIL import ImageSequence
+from src.config import load_env
+
+load_env()
+
+# Thresholds of the local pre-check run before any vision call
+MIN_SIDE = int(os.getenv('IMAGE_MIN_SIDE', '240'))
+MIN_SHARPNESS = float(os.getenv('IMAGE_MIN_SHARPNESS', '15'))
+# Share of near-black / near-white pixels above which an image is under / over exposed
+MAX_CLIPPED = 0.7
+# Grey-level standard deviation below which an image is blank rather than a photo
+MIN_CONTRAST = 8
+
+# Metrics are computed on a copy no larger than this, so the check stays a few milliseconds
+_ANALYSIS_SIDE = 512
+# Frames checked per animated or multi-page file
+MAX_FRAMES = 16
+
+def assess_image(image):
+    """Measure resolution, exposure and sharpness of a PIL image.
+
+    Returns the metrics, a score for ranking frames, and the reasons
+    (too_small, too_dark, too_bright, blank, blurry) the image is unusable.
+    """
+    width, height = image.size
+    gray = image.convert('L')
+    gray.thumbnail((_ANALYSIS_SIDE, _ANALYSIS_SIDE))
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    histogram = np.bincount(pixels.astype(np.uint8).ravel(), minlength=256) / pixels.size
+    dark = float(histogram[:20].sum())
+    bright = float(histogram[236:].sum())
+    contrast = float(pixels.std())
+    # Variance of the 4-neighbour Laplacian: low when edges are soft
+    laplacian = (pixels[1:-1, :-2] + pixels[1:-1, 2:] + pixels[:-2, 1:-1] + pixels[2:, 1:-1]
+                 - 4 * pixels[1:-1, 1:-1])
+    sharpness = float(laplacian.var()) if laplacian.size else 0.0
+
+    reasons = []
+    if min(width, height) < MIN_SIDE:
+        reasons.append('too_small')
+    if dark > MAX_CLIPPED:
+        reasons.append('too_dark')
+    if bright > MAX_CLIPPED:
+        reasons.append('too_bright')
+    if contrast < MIN_CONTRAST:
+        reasons.append('blank')
+    elif sharpness < MIN_SHARPNESS:
+        reasons.append('blurry')
+    return {
+        'width': width,
+        'height': height,
+        'brightness': float(pixels.mean()),
+        'dark': dark,
+        'bright': bright,
+        'contrast': contrast,
+        'sharpness': sharpness,
+        'score': sharpness * (1 - dark - bright) * min(1.0, min(width, height) / 1000),
+        'ok': not reasons,
+        'reasons': reasons
+    }
+
+def iter_frames(image, max_frames=MAX_FRAMES):
+    """Yield the frames of an animated or multi-page image (or the image itself), at most max_frames"""
+    n_frames = getattr(image, 'n_frames', 1)
+    step = max(1, -(-n_frames // max_frames))
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if index % step == 0:
+            yield frame.copy()
+
+def pick_best(images):
+    """Get the (image, quality) of the best of several images, usable ones first"""
+    best = None
+    for image in images:
+        quality = assess_image(image)
+        if best is None or (quality['ok'], quality['score']) > (best[1]['ok'], best[1]['score']):
+            best = (image, quality)
+    return best
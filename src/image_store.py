@@ -0,0 +1,47 @@
+import os
+import tempfile
+from src.config import load_env
+from src.image_utils import image_hash as hash_image
+
+load_env()
+
+# Root of the content-addressed store: <CAR_IMAGE_DIR>/ab/abcdef....jpg
+IMAGE_DIR = os.getenv('CAR_IMAGE_DIR', 'images')
+
+def image_path(image_hash):
+    """Get the path of a stored image from its hash"""
+    return os.path.join(IMAGE_DIR, image_hash[:2], f"{image_hash}.jpg")
+
+def put_image(data):
+    """Store encoded image bytes once and return their hash"""
+    image_hash = hash_image(data)
+    path = image_path(image_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+    return image_hash
+
+def read_image(image_hash):
+    """Get the encoded bytes of a stored image, or None if it is missing"""
+    if not image_hash:
+        return None
+    try:
+        with open(image_path(image_hash), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def delete_image(image_hash):
+    """Remove a stored image that is no longer referenced"""
+    try:
+        os.remove(image_path(image_hash))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,25 @@
+import io
+import hashlib
+
+def to_jpeg_bytes(image):
+    """Encode a PIL image as JPEG bytes"""
+    # JPEG has no alpha channel or palette
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG')
+    return img_byte_arr.getvalue()
+
+def image_hash(data):
+    """Get the SHA-256 hex digest identifying encoded image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+def crop_box(image, box, padding=0.04):
+    """Crop a PIL image to a [ymin, xmin, ymax, xmax] box scaled to 0-1000, with some margin"""
+    ymin, xmin, ymax, xmax = (min(max(float(value), 0), 1000) / 1000 for value in box)
+    if ymax <= ymin or xmax <= xmin:
+        raise ValueError(f"Empty box: {box!r}")
+    pad_y, pad_x = (ymax - ymin) * padding, (xmax - xmin) * padding
+    width, height = image.size
+    return image.crop((round(max(xmin - pad_x, 0) * width), round(max(ymin - pad_y, 0) * height),
+                       round(min(xmax + pad_x, 1) * width), round(min(ymax + pad_y, 1) * height)))
@@ -0,0 +1,57 @@
+import re
+from src.prompts import get_prompt
+from src.response_cache import get_cached, put_cached
+from src.llm_ledger import record_call
+
+# Start of the answer section of photo n, as asked by the interior prompt
+_SECTION = re.compile(r'^\s*#*\s*\[(\d+)\]\s*$', re.MULTILINE)
+
+def split_sections(text, count):
+    """Split a multi-photo answer into one text per photo, or None when the sections don't match"""
+    if count == 1 and not _SECTION.search(text):
+        return [text.strip()]
+    matches = list(_SECTION.finditer(text))
+    sections = {}
+    for match, end in zip(matches, [m.start() for m in matches[1:]] + [len(text)]):
+        sections[int(match.group(1))] = text[match.end():end].strip()
+    if sorted(sections) != list(range(1, count + 1)):
+        return None
+    return [sections[number] for number in range(1, count + 1)]
+
+def describe_interiors(images, vision_model, language='English'):
+    """Describe interior photos, given as (image hash, JPEG bytes) pairs, in the order given.
+
+    Descriptions are cached per image hash and language; the uncached
+    photos are sent together in one request.
+    """
+    template = get_prompt('interior', 'Arabic' if language == 'Arabic' else 'English')
+    keys = [template.cache_key(image=image_hash) for image_hash, _ in images]
+    descriptions = [get_cached(key) for key in keys]
+    for description in descriptions:
+        if description is not None:
+            record_call('interior', vision_model.model_name, language=language, cache_status='hit')
+
+    # Repeated photos are sent once
+    missing = {}
+    for key, (_, data), description in zip(keys, images, descriptions):
+        if description is None:
+            missing.setdefault(key, data)
+    if missing:
+        contents = [template.render(count=len(missing))]
+        for number, data in enumerate(missing.values(), start=1):
+            contents.extend([f"[{number}]", {"mime_type": "image/jpeg", "data": data}])
+        response = vision_model.generate_content(contents, call_type='interior', language=language)
+        if not response or not response.text:
+            raise Exception("Received empty response from Gemini")
+
+        sections = split_sections(response.text, len(missing))
+        if sections is None:
+            # Show the whole answer rather than losing it, but don't cache it per photo
+            sections = [response.text.strip()] + [""] * (len(missing) - 1)
+        else:
+            for key, section in zip(missing, sections):
+                put_cached(key, 'interior', section)
+        answers = dict(zip(missing, sections))
+        descriptions = [answers[key] if description is None else description
+                        for key, description in zip(keys, descriptions)]
+    return descriptions
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.config import load_env
+from src.database import WRITE_TIMEOUT, get_connection, submit_write
+
+load_env()
+
+# Threads running jobs, shared by all sessions
+JOB_WORKERS = int(os.getenv('CAR_JOB_WORKERS', '2'))
+# A finished job is returned again for identical input submitted within this many seconds
+JOB_REUSE_SECONDS = 600
+# Seconds between the heartbeats of a process's unfinished jobs, and without one after
+# which any process fails a job as interrupted (its process died)
+JOB_HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = 4 * JOB_HEARTBEAT_SECONDS
+# Tries at recording a job's outcome before it is left to expire as interrupted
+JOB_FINISH_ATTEMPTS = 3
+
+# Identifies the jobs of this process in the shared jobs table
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lock = threading.Lock()
+_executor = None
+# Jobs of this process whose outcome could not be recorded; no longer kept alive
+_abandoned = set()
+_abandoned_lock = threading.Lock()
+# Runs a job kind: handler(payload, api_key, data) -> JSON-serializable result
+_handlers = {}
+
+def register_handler(kind, handler):
+    """Run jobs of a kind with handler(payload, api_key, data)"""
+    _handlers[kind] = handler
+
+def _beat(c):
+    # Mark this process's unfinished jobs alive, and fail those of processes that died
+    now = time.time()
+    with _abandoned_lock:
+        abandoned = list(_abandoned)
+    c.execute(f'''UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('queued', 'running')
+                  AND id NOT IN ({', '.join('?' for _ in abandoned)})''',
+              (now, OWNER, *abandoned))
+    c.execute('''UPDATE jobs SET status = 'failed', error = 'interrupted', updated_at = ?
+                 WHERE status IN ('queued', 'running') AND COALESCE(heartbeat_at, updated_at) < ?''',
+              (now, now - JOB_STALE_SECONDS))
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            submit_write(_beat).result(timeout=WRITE_TIMEOUT)
+        except Exception as e:
+            print(f"Error updating job heartbeats: {str(e)}")
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            submit_write(_beat).result(timeout=WRITE_TIMEOUT)
+            threading.Thread(target=_heartbeat_loop, name='job-heartbeat', daemon=True).start()
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+def _write_update(c, job_id, values):
+    columns = ', '.join(f'{column} = ?' for column in values)
+    c.execute(f'UPDATE jobs SET {columns}, updated_at = ? WHERE id = ?',
+              (*values.values(), time.time(), job_id))
+
+def _update(job_id, **values):
+    submit_write(_write_update, job_id, values).result(timeout=WRITE_TIMEOUT)
+
+def _finish(job_id, **values):
+    # A job left 'running' would be polled forever, so retry, then stop its heartbeat
+    # so that the next sweep fails it as interrupted
+    for attempt in range(JOB_FINISH_ATTEMPTS):
+        try:
+            _update(job_id, **values)
+            return
+        except Exception as e:
+            print(f"Error recording the outcome of job {job_id}: {str(e)}")
+            time.sleep(2 ** attempt)
+    with _abandoned_lock:
+        _abandoned.add(job_id)
+
+def _run(job_id, kind, payload, api_key, data):
+    try:
+        _update(job_id, status='running')
+        result = json.dumps(_handlers[kind](payload, api_key, data), ensure_ascii=False)
+    except Exception as e:
+        print(f"Error running job {job_id}: {str(e)}")
+        _finish(job_id, status='failed', error=str(e))
+    else:
+        _finish(job_id, status='done', result=result)
+
+def _insert_job(c, kind, dedupe_key, payload, reuse):
+    # Look up and insert in the writer's transaction, so identical submissions share one job
+    now = time.time()
+    c.execute('''SELECT id FROM jobs WHERE dedupe_key = ?
+                 AND ((status IN ('queued', 'running') AND heartbeat_at > ?)
+                      OR (status = 'done' AND updated_at > ?))
+                 ORDER BY created_at DESC LIMIT 1''',
+              (dedupe_key, now - JOB_STALE_SECONDS, now - JOB_REUSE_SECONDS if reuse else now))
+    row = c.fetchone()
+    if row:
+        return row[0], False
+    job_id = uuid.uuid4().hex
+    c.execute('''INSERT INTO jobs (id, kind, dedupe_key, payload, status, created_at, updated_at,
+                                   owner, heartbeat_at)
+                 VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)''',
+              (job_id, kind, dedupe_key, json.dumps(payload, ensure_ascii=False), now, now, OWNER, now))
+    return job_id, True
+
+def submit_job(kind, payload, api_key, data=None, reuse=True):
+    """Queue a job and return its id, or the id of an identical queued, running or recent job.
+
+    The payload and a hash of the API key identify the job; data (e.g. image
+    bytes) and the API key itself are only handed to the worker. With reuse=False a finished
+    job is never returned, so the work runs again.
+    """
+    executor = _get_executor()
+    # Sessions only share the jobs of their own API key, which is never stored itself
+    key_id = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+    dedupe_key = hashlib.sha256(f"{kind}:{key_id}:{json.dumps(payload, sort_keys=True)}"
+                                .encode('utf-8')).hexdigest()
+    job_id, created = submit_write(_insert_job, kind, dedupe_key, payload, reuse).result(timeout=WRITE_TIMEOUT)
+    if created:
+        executor.submit(_run, job_id, kind, payload, api_key, data)
+    return job_id
+
+def get_job(job_id):
+    """Get a job's status ('queued', 'running', 'done' or 'failed'), result and error, or None"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, kind, status, result, error, created_at, updated_at FROM jobs WHERE id = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {
+        'id': row[0],
+        'kind': row[1],
+        'status': row[2],
+        'result': json.loads(row[3]) if row[3] else None,
+        'error': row[4],
+        'created_at': row[5],
+        'updated_at': row[6]
+    }
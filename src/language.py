@@ -1,114 +1,21 @@
 import streamlit as st
+from src.prompts import get_prompt, SPEC_LIST_FIELDS
+from src.translation import needs_translation, translate_texts
 
 def get_language_prompts(language):
     """Get language-specific prompts"""
-    if language == "Arabic":
-        return {
-            "detection_prompt": """قم بتحليل الصورة وتحديد معلومات السيارة. يجب أن تكون الإجابة بتنسيق JSON فقط، بدون أي نص إضافي قبل أو بعد JSON.
-
-التنسيق المطلوب:
-{
-    "brand": "اسم الماركة",
-    "model": "اسم الموديل",
-    "year": "سنة الصنع",
-    "type": "نوع السيارة"
-}
-
-لا تضع أي نص قبل أو بعد JSON.""",
-            "specs_prompt": """قم بتوفير مواصفات السيارة {year} {brand} {model}. يجب أن تكون الإجابة بتنسيق JSON فقط، بدون أي نص إضافي قبل أو بعد JSON.
+    return _LANGUAGE_PROMPTS["Arabic" if language == "Arabic" else "English"]
 
-التنسيق المطلوب:
-{
-    "basic_info": {
-        "brand": "اسم الماركة",
-        "model": "اسم الموديل",
-        "year": "سنة الصنع",
-        "type": "نوع السيارة"
-    },
-    "performance": {
-        "fuel_consumption": "استهلاك الوقود",
-        "engine_size": "حجم المحرك",
-        "cylinders": "عدد الأسطوانات",
-        "transmission": "نوع ناقل الحركة",
-        "fuel_type": "نوع الوقود",
-        "horsepower": "قوة المحرك",
-        "torque": "عزم الدوران",
-        "top_speed": "السرعة القصوى",
-        "acceleration": "التسارع"
-    },
-    "technical_specs": {
-        "length": "الطول",
-        "width": "العرض",
-        "height": "الارتفاع",
-        "wheelbase": "قاعدة العجلات",
-        "weight": "الوزن",
-        "seating_capacity": "سعة المقاعد",
-        "trunk_capacity": "سعة الصندوق"
-    },
-    "features": {
-        "price_range": "نطاق السعر",
-        "safety_features": ["ميزات الأمان"],
-        "comfort_features": ["ميزات الراحة"],
-        "technology_features": ["ميزات التكنولوجيا"]
+# Built once from the prompt registry instead of on every call
+_LANGUAGE_PROMPTS = {
+    language: {
+        "detection_prompt": get_prompt("detection", language).text,
+        # Specifications are generated once, language-neutral, and localized locally
+        "specs_prompt": get_prompt("specs", "English").text
     }
+    for language in ("English", "Arabic")
 }
 
-لا تضع أي نص قبل أو بعد JSON."""
-        }
-    else:
-        return {
-            "detection_prompt": """Analyze the image and identify the car information. The response must be in JSON format only, with no additional text before or after the JSON.
-
-Required format:
-{
-    "brand": "brand name",
-    "model": "model name",
-    "year": "manufacturing year",
-    "type": "car type"
-}
-
-Do not include any text before or after the JSON.""",
-            "specs_prompt": """Provide specifications for the {year} {brand} {model}. The response must be in JSON format only, with no additional text before or after the JSON.
-
-Required format:
-{
-    "basic_info": {
-        "brand": "brand name",
-        "model": "model name",
-        "year": "manufacturing year",
-        "type": "car type"
-    },
-    "performance": {
-        "fuel_consumption": "fuel consumption",
-        "engine_size": "engine size",
-        "cylinders": "number of cylinders",
-        "transmission": "transmission type",
-        "fuel_type": "fuel type",
-        "horsepower": "horsepower",
-        "torque": "torque",
-        "top_speed": "top speed",
-        "acceleration": "acceleration"
-    },
-    "technical_specs": {
-        "length": "length",
-        "width": "width",
-        "height": "height",
-        "wheelbase": "wheelbase",
-        "weight": "weight",
-        "seating_capacity": "seating capacity",
-        "trunk_capacity": "trunk capacity"
-    },
-    "features": {
-        "price_range": "price range",
-        "safety_features": ["safety features"],
-        "comfort_features": ["comfort features"],
-        "technology_features": ["technology features"]
-    }
-}
-
-Do not include any text before or after the JSON."""
-        }
-
 def get_language_texts(language):
     """Get language-specific UI texts"""
     if language == "Arabic":
@@ -154,4 +61,168 @@ def get_language_texts(language):
             "safety": "Safety Features",
             "comfort": "Comfort Features",
             "tech": "Technology Features"
-        } 
\ No newline at end of file
+        } 
+
+# Labels of the canonical spec units and ids (see SPEC_UNITS, SPEC_ENUMS and FEATURE_IDS)
+SPEC_LABELS = {
+    "English": {
+        "fields": {
+            "brand": "Brand", "model": "Model", "year": "Year", "type": "Type",
+            "fuel_consumption": "Fuel Consumption", "engine_size": "Engine Size",
+            "cylinders": "Cylinders", "transmission": "Transmission", "fuel_type": "Fuel Type",
+            "horsepower": "Horsepower", "torque": "Torque", "top_speed": "Top Speed",
+            "acceleration": "Acceleration", "length": "Length", "width": "Width", "height": "Height",
+            "wheelbase": "Wheelbase", "weight": "Weight", "seating_capacity": "Seating Capacity",
+            "trunk_capacity": "Trunk Capacity"
+        },
+        "units": {
+            "fuel_consumption": "L/100km", "engine_size": "cc", "horsepower": "hp", "torque": "Nm",
+            "top_speed": "km/h", "acceleration": "s (0-100 km/h)", "length": "mm", "width": "mm",
+            "height": "mm", "wheelbase": "mm", "weight": "kg", "trunk_capacity": "L"
+        },
+        "price": "${low} - ${high}",
+        "values": {
+            "sedan": "Sedan", "suv": "SUV", "crossover": "Crossover", "hatchback": "Hatchback",
+            "coupe": "Coupe", "convertible": "Convertible", "wagon": "Wagon", "pickup": "Pickup",
+            "van": "Van", "minivan": "Minivan", "sports_car": "Sports Car", "luxury": "Luxury",
+            "automatic": "Automatic", "manual": "Manual", "cvt": "CVT", "dct": "Dual-clutch",
+            "petrol": "Petrol", "diesel": "Diesel", "hybrid": "Hybrid",
+            "plug_in_hybrid": "Plug-in hybrid", "electric": "Electric",
+            "abs": "ABS", "airbags": "Airbags", "esc": "Electronic stability control",
+            "traction_control": "Traction control",
+            "automatic_emergency_braking": "Automatic emergency braking",
+            "forward_collision_warning": "Forward collision warning",
+            "lane_departure_warning": "Lane departure warning",
+            "lane_keeping_assist": "Lane keeping assist",
+            "blind_spot_monitoring": "Blind spot monitoring",
+            "rear_cross_traffic_alert": "Rear cross-traffic alert",
+            "adaptive_cruise_control": "Adaptive cruise control",
+            "parking_sensors": "Parking sensors", "rear_camera": "Rear camera",
+            "camera_360": "360° camera", "isofix": "ISOFIX child seat anchors",
+            "climate_control": "Climate control",
+            "dual_zone_climate_control": "Dual-zone climate control",
+            "heated_seats": "Heated seats", "ventilated_seats": "Ventilated seats",
+            "leather_seats": "Leather seats", "power_seats": "Power seats", "sunroof": "Sunroof",
+            "keyless_entry": "Keyless entry", "push_button_start": "Push-button start",
+            "power_tailgate": "Power tailgate", "cruise_control": "Cruise control",
+            "touchscreen": "Touchscreen", "navigation": "Navigation",
+            "apple_carplay": "Apple CarPlay", "android_auto": "Android Auto",
+            "bluetooth": "Bluetooth", "wireless_charging": "Wireless charging",
+            "premium_audio": "Premium audio", "digital_cluster": "Digital instrument cluster",
+            "head_up_display": "Head-up display", "usb_ports": "USB ports"
+        }
+    },
+    "Arabic": {
+        "fields": {
+            "brand": "الشركة المصنعة", "model": "الموديل", "year": "السنة", "type": "الفئة",
+            "fuel_consumption": "استهلاك الوقود", "engine_size": "سعة المحرك",
+            "cylinders": "عدد الأسطوانات", "transmission": "ناقل الحركة", "fuel_type": "نوع الوقود",
+            "horsepower": "القوة الحصانية", "torque": "عزم الدوران", "top_speed": "السرعة القصوى",
+            "acceleration": "التسارع", "length": "الطول", "width": "العرض", "height": "الارتفاع",
+            "wheelbase": "قاعدة العجلات", "weight": "الوزن", "seating_capacity": "عدد المقاعد",
+            "trunk_capacity": "سعة صندوق الأمتعة"
+        },
+        "units": {
+            "fuel_consumption": "لتر/100 كم", "engine_size": "سي سي", "horsepower": "حصان",
+            "torque": "نيوتن متر", "top_speed": "كم/ساعة", "acceleration": "ثانية (0-100 كم/ساعة)",
+            "length": "مم", "width": "مم", "height": "مم", "wheelbase": "مم", "weight": "كغ",
+            "trunk_capacity": "لتر"
+        },
+        "price": "{low} - {high} دولار",
+        "values": {
+            "sedan": "سيدان", "suv": "دفع رباعي (SUV)", "crossover": "كروس أوفر",
+            "hatchback": "هاتشباك", "coupe": "كوبيه", "convertible": "مكشوفة", "wagon": "ستيشن",
+            "pickup": "بيك أب", "van": "فان", "minivan": "ميني فان", "sports_car": "رياضية",
+            "luxury": "فاخرة",
+            "automatic": "أوتوماتيك", "manual": "يدوي", "cvt": "CVT متغير باستمرار",
+            "dct": "ثنائي القابض", "petrol": "بنزين", "diesel": "ديزل", "hybrid": "هجين",
+            "plug_in_hybrid": "هجين قابل للشحن", "electric": "كهربائي",
+            "abs": "نظام منع انغلاق المكابح (ABS)", "airbags": "وسائد هوائية",
+            "esc": "نظام التحكم الإلكتروني بالثبات", "traction_control": "نظام التحكم بالجر",
+            "automatic_emergency_braking": "الكبح التلقائي في حالات الطوارئ",
+            "forward_collision_warning": "تحذير من الاصطدام الأمامي",
+            "lane_departure_warning": "تحذير مغادرة المسار",
+            "lane_keeping_assist": "مساعد البقاء في المسار",
+            "blind_spot_monitoring": "مراقبة النقطة العمياء",
+            "rear_cross_traffic_alert": "تنبيه حركة المرور الخلفية",
+            "adaptive_cruise_control": "مثبت سرعة تكيفي",
+            "parking_sensors": "حساسات ركن", "rear_camera": "كاميرا خلفية",
+            "camera_360": "كاميرا 360 درجة", "isofix": "نقاط تثبيت مقاعد الأطفال ISOFIX",
+            "climate_control": "تكييف أوتوماتيكي",
+            "dual_zone_climate_control": "تكييف أوتوماتيكي ثنائي المنطقة",
+            "heated_seats": "مقاعد مدفأة", "ventilated_seats": "مقاعد مهواة",
+            "leather_seats": "مقاعد جلدية", "power_seats": "مقاعد كهربائية",
+            "sunroof": "فتحة سقف", "keyless_entry": "دخول بدون مفتاح",
+            "push_button_start": "تشغيل بضغطة زر", "power_tailgate": "باب خلفي كهربائي",
+            "cruise_control": "مثبت سرعة",
+            "touchscreen": "شاشة لمس", "navigation": "نظام ملاحة",
+            "apple_carplay": "Apple CarPlay", "android_auto": "Android Auto",
+            "bluetooth": "بلوتوث", "wireless_charging": "شحن لاسلكي",
+            "premium_audio": "نظام صوتي فاخر", "digital_cluster": "عدادات رقمية",
+            "head_up_display": "شاشة عرض على الزجاج الأمامي", "usb_ports": "منافذ USB"
+        }
+    }
+}
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return f"{value:,}" if isinstance(value, int) and abs(value) >= 10000 else str(value)
+
+def _spec_id(value):
+    return value.strip().lower().replace(' ', '_').replace('-', '_')
+
+def _localize_value(field, value, labels):
+    # Canonical values are numbers and ids; anything else is shown as stored
+    if isinstance(value, bool) or value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        unit = labels["units"].get(field)
+        return f"{_format_number(value)} {unit}" if unit else _format_number(value)
+    if field == "price_range" and isinstance(value, list):
+        if len(value) == 2 and all(isinstance(price, (int, float)) for price in value):
+            return labels["price"].format(low=_format_number(value[0]), high=_format_number(value[1]))
+        return " - ".join(str(price) for price in value)
+    if isinstance(value, str):
+        return labels["values"].get(_spec_id(value), value)
+    return value
+
+def localize_specs(specs, language, text_model=None):
+    """Render canonical specifications as display strings in the given language.
+
+    Units and ids come from SPEC_LABELS. Free-text items written in another
+    language are translated through the translation cache, and only when a
+    text model is given for the ones not cached yet. Specifications saved
+    before the canonical form are returned with their strings unchanged.
+    """
+    language = "Arabic" if language == "Arabic" else "English"
+    labels = SPEC_LABELS[language]
+    localized = {}
+    free_text = set()
+    for section, values in specs.items():
+        if not isinstance(values, dict):
+            localized[section] = values
+            continue
+        localized[section] = {}
+        for field, value in values.items():
+            if field in SPEC_LIST_FIELDS and isinstance(value, list):
+                localized[section][field] = [_localize_value(field, item, labels) for item in value]
+                free_text.update(item for item in value if isinstance(item, str)
+                                 and _spec_id(item) not in labels["values"]
+                                 and needs_translation(item, language))
+            elif section == "basic_info" and field != "type":
+                # Names are kept as they are
+                localized[section][field] = value
+            else:
+                localized[section][field] = _localize_value(field, value, labels)
+
+    # Translate the remaining free text (features not in the vocabulary) in one batch
+    if free_text:
+        translations = translate_texts(free_text, language, text_model)
+        for section in localized.values():
+            if not isinstance(section, dict):
+                continue
+            for field in SPEC_LIST_FIELDS & section.keys():
+                if isinstance(section[field], list):
+                    section[field] = [translations.get(item, item) for item in section[field]]
+    return localized
@@ -0,0 +1,160 @@
+"""Streaming NDJSON export and import of the car library.
+
+Each line is one car: {"id", "details", "specs", "image_hash"} plus either
+"image" (base64 JPEG), "image_file" (a file next to the export) or neither.
+
+    python -m src.library_io export cars.ndjson [--images-dir DIR | --no-images]
+    python -m src.library_io import cars.ndjson [--images-dir DIR] [--batch-size N]
+"""
+import os
+import sys
+import json
+import base64
+import shutil
+import argparse
+from src.database import get_connection, car_columns, save_cars
+from src.image_store import image_path
+from src.image_utils import image_hash as hash_image
+
+# Rows read from or written to the database per round trip / transaction
+BATCH_SIZE = 500
+
+def iter_car_rows(batch_size=BATCH_SIZE):
+    """Yield (id, details_json, specs_json, image_hash) rows of every car, in id order"""
+    conn = get_connection()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT id, details, specs, image_hash FROM cars ORDER BY id')
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+def iter_export_lines(image_dir=None, include_images=True, batch_size=BATCH_SIZE):
+    """Yield one NDJSON line per car, copying images to image_dir when given"""
+    for car_id, details, specs, image_hash in iter_car_rows(batch_size):
+        # details and specs are already JSON, so they are written without parsing them
+        line = f'{{"id":{car_id},"details":{details},"specs":{specs},"image_hash":{json.dumps(image_hash)}'
+        if image_hash and os.path.exists(image_path(image_hash)):
+            if image_dir:
+                file_name = f"{image_hash}.jpg"
+                target = os.path.join(image_dir, file_name)
+                if not os.path.exists(target):
+                    shutil.copyfile(image_path(image_hash), target)
+                line += f',"image_file":{json.dumps(file_name)}'
+            elif include_images:
+                with open(image_path(image_hash), 'rb') as f:
+                    line += f',"image":"{base64.b64encode(f.read()).decode("ascii")}"'
+        yield line + '}\n'
+
+def export_library(path, image_dir=None, include_images=True, batch_size=BATCH_SIZE):
+    """Write the library to an NDJSON file and return the number of cars"""
+    if image_dir:
+        os.makedirs(image_dir, exist_ok=True)
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in iter_export_lines(image_dir, include_images, batch_size):
+            f.write(line)
+            count += 1
+    return count
+
+def _read_image(car, image_dir):
+    if car.get('image'):
+        return base64.b64decode(car['image'])
+    if car.get('image_file') and image_dir:
+        with open(os.path.join(image_dir, os.path.basename(car['image_file'])), 'rb') as f:
+            return f.read()
+    return None
+
+def _is_duplicate(c, image_hash, columns):
+    brand, model, year, _ = columns
+    if image_hash:
+        c.execute('SELECT 1 FROM cars WHERE image_hash = ? LIMIT 1', (image_hash,))
+        if c.fetchone():
+            return True
+    if brand and model:
+        c.execute('''SELECT 1 FROM cars WHERE brand = ? COLLATE NOCASE AND model = ? COLLATE NOCASE
+                     AND year IS ? LIMIT 1''', (brand, model, year))
+        if c.fetchone():
+            return True
+    return False
+
+def import_library(path, image_dir=None, batch_size=BATCH_SIZE):
+    """Import an NDJSON export, skipping cars already in the library.
+
+    A car is a duplicate when its image hash, or its normalized
+    brand/model/year, matches a saved car (or one earlier in the file).
+    The others are saved with save_cars, one transaction per batch, so
+    they get identity keys and timestamps like detected cars.
+    Returns counts of the read, imported, duplicate and invalid lines.
+    """
+    if image_dir is None:
+        image_dir = os.path.dirname(os.path.abspath(path))
+    stats = {'read': 0, 'imported': 0, 'duplicates': 0, 'errors': 0}
+    conn = get_connection()
+    c = conn.cursor()
+    batch = []
+    # Identities of the batch not inserted yet, so duplicates inside the file are caught too
+    pending = set()
+
+    def flush():
+        save_cars(batch, batch_size=len(batch))
+        stats['imported'] += len(batch)
+        batch.clear()
+        pending.clear()
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                stats['read'] += 1
+                try:
+                    car = json.loads(line)
+                    image = _read_image(car, image_dir)
+                    image_hash = hash_image(image) if image else None
+                    columns = car_columns(car['details'])
+                    brand, model, year, _ = columns
+                    identity = (brand.lower(), model.lower(), year) if brand and model else None
+                except Exception as e:
+                    print(f"Error importing line {stats['read']}: {str(e)}")
+                    stats['errors'] += 1
+                    continue
+
+                if (image_hash in pending or identity in pending
+                        or _is_duplicate(c, image_hash, columns)):
+                    stats['duplicates'] += 1
+                    continue
+                pending.update({identity, image_hash} - {None})
+                batch.append({'details': car['details'], 'specs': car['specs'], 'image': image})
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+    finally:
+        conn.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the car library as NDJSON")
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('path', help="NDJSON file")
+    parser.add_argument('--images-dir', help="write/read images as separate files in this directory")
+    parser.add_argument('--no-images', action='store_true', help="export without images")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        count = export_library(args.path, args.images_dir, not args.no_images, args.batch_size)
+        print(f"Exported {count} cars to {args.path}")
+    else:
+        stats = import_library(args.path, args.images_dir, args.batch_size)
+        print(json.dumps(stats))
+        if stats['errors']:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import json
+import time
+import uuid
+import weakref
+from src.database import get_connection, submit_write
+from src.profiling import span
+
+# Ledger call key of each live response, until its JSON has been parsed
+_response_keys = weakref.WeakKeyDictionary()
+
+def _usage(response):
+    # usage_metadata is only returned by newer API versions
+    usage = getattr(response, 'usage_metadata', None) if response is not None else None
+    if usage is None:
+        return None, None, None
+    return (getattr(usage, 'prompt_token_count', None),
+            getattr(usage, 'candidates_token_count', None),
+            getattr(usage, 'total_token_count', None))
+
+def prompt_size(contents):
+    """Get the (text chars, inline data bytes) sizes of a prompt"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    chars = 0
+    data_bytes = 0
+    for part in parts:
+        if isinstance(part, str):
+            chars += len(part)
+        elif isinstance(part, dict) and isinstance(part.get('data'), (bytes, bytearray)):
+            data_bytes += len(part['data'])
+    return chars, data_bytes
+
+def _insert_call(c, values):
+    c.execute('''INSERT INTO llm_calls
+                 (call_key, created_at, call_type, model, language, prompt_chars, prompt_bytes,
+                  response_chars, prompt_tokens, response_tokens, total_tokens,
+                  latency_ms, queue_wait_ms, cache_status, parse_status, error)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', values)
+
+def _update_parse(c, call_key, parse_status):
+    c.execute('UPDATE llm_calls SET parse_status = ? WHERE call_key = ?', (parse_status, call_key))
+
+def record_call(call_type, model, contents=None, response=None, response_text=None,
+                language=None, latency=None, queue_wait=None, cache_status='miss',
+                parse_status=None, error=None):
+    """Record one Gemini call (or cache hit) in the ledger and return its call key.
+
+    Nobody waits for the row: the writer commits it with the next writes, so
+    recording never delays the call (or cache hit) it describes.
+    """
+    try:
+        prompt_chars, prompt_bytes = prompt_size(contents) if contents is not None else (None, None)
+        prompt_tokens, response_tokens, total_tokens = _usage(response)
+        call_key = uuid.uuid4().hex
+        submit_write(_insert_call, (
+            call_key, time.time(), call_type, model, language, prompt_chars, prompt_bytes,
+            len(response_text) if response_text is not None else None,
+            prompt_tokens, response_tokens, total_tokens,
+            latency * 1000 if latency is not None else None,
+            queue_wait * 1000 if queue_wait is not None else None,
+            cache_status, parse_status, error))
+        return call_key
+    except Exception as e:
+        # The ledger must never break the call it is recording
+        print(f"Error recording LLM call: {str(e)}")
+        return None
+
+def track_response(response, call_key):
+    """Remember the ledger call key of a response so its parse outcome can be added"""
+    if call_key is not None:
+        _response_keys[response] = call_key
+
+def record_parse(response, ok):
+    """Record whether the JSON in a response could be parsed"""
+    call_key = _response_keys.pop(response, None)
+    if call_key is None:
+        return
+    # Queued after the call's insert, so the single writer always applies it second
+    submit_write(_update_parse, call_key, 'ok' if ok else 'failed')
+
+def load_json(response, json_str, convert=None):
+    """Parse the cleaned JSON text of a response, recording the outcome.
+
+    convert, when given, turns the parsed data into the result; a ValueError
+    it raises (e.g. a malformed structure) is recorded as a parse failure too.
+    """
+    try:
+        with span('json.parse', chars=len(json_str)):
+            data = json.loads(json_str)
+            if convert is not None:
+                data = convert(data)
+    except ValueError:
+        # json.JSONDecodeError is a ValueError
+        record_parse(response, False)
+        raise
+    record_parse(response, True)
+    return data
+
+def summarize(since=None, group_by=('call_type', 'language')):
+    """Summarize the ledger per call site (and language) since a timestamp"""
+    columns = ', '.join(group_by)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''SELECT {columns},
+                         COUNT(*),
+                         SUM(cache_status = 'hit'),
+                         AVG(CASE WHEN cache_status != 'hit' THEN latency_ms END),
+                         MAX(latency_ms),
+                         AVG(queue_wait_ms),
+                         SUM(latency_ms),
+                         AVG(prompt_chars),
+                         AVG(response_chars),
+                         SUM(prompt_tokens),
+                         SUM(response_tokens),
+                         SUM(parse_status = 'failed'),
+                         SUM(error IS NOT NULL)
+                  FROM llm_calls
+                  WHERE created_at >= ?
+                  GROUP BY {columns}
+                  ORDER BY SUM(latency_ms) DESC''', (since or 0,))
+    names = list(group_by) + ['calls', 'cache_hits', 'avg_latency_ms', 'max_latency_ms',
+                              'avg_queue_wait_ms', 'total_latency_ms', 'avg_prompt_chars',
+                              'avg_response_chars', 'prompt_tokens', 'response_tokens',
+                              'parse_failures', 'errors']
+    rows = [dict(zip(names, row)) for row in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_recent_failures(limit=20):
+    """Get the latest calls that errored or returned unparseable JSON"""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''SELECT created_at, call_type, language, latency_ms, parse_status, error
+                 FROM llm_calls
+                 WHERE error IS NOT NULL OR parse_status = 'failed'
+                 ORDER BY id DESC LIMIT ?''', (limit,))
+    names = ['created_at', 'call_type', 'language', 'latency_ms', 'parse_status', 'error']
+    rows = [dict(zip(names, row)) for row in c.fetchall()]
+    conn.close()
+    return rows
@@ -0,0 +1,227 @@
+"""Maintenance of cars.db and the image store.
+
+    python -m src.maintenance stats
+    python -m src.maintenance recompress [--max-side 1280] [--quality 80]
+    python -m src.maintenance prune [--max-age-days N] [--keep N] [--ledger-days N]
+    python -m src.maintenance vacuum [--step-pages 256]
+"""
+import io
+import os
+import json
+import time
+import argparse
+from src.database import (DB_PATH, WRITE_TIMEOUT, get_connection, submit_write, after_commit,
+                          delete_cars, notify_change)
+from src.image_store import IMAGE_DIR, image_path, put_image, read_image, delete_image
+
+# Rows handled per transaction, so readers are never blocked for long
+BATCH_SIZE = 50
+
+def _table_bytes(c):
+    # dbstat is optional in SQLite builds; without it sizes come from the column sums
+    try:
+        c.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+        return dict(c.fetchall())
+    except Exception:
+        return {}
+
+def storage_stats():
+    """Get the rows and bytes of every table and column, and of the image store"""
+    conn = get_connection()
+    c = conn.cursor()
+    table_bytes = _table_bytes(c)
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    tables = [row[0] for row in c.fetchall()]
+    rows = []
+    for table in tables:
+        columns = [column[1] for column in c.execute(f'PRAGMA table_info({table})')]
+        sums = ', '.join(f'SUM(LENGTH("{column}"))' for column in columns)
+        c.execute(f'SELECT COUNT(*), {sums} FROM "{table}"')
+        count, *column_bytes = c.fetchone()
+        rows.append({
+            'table': table,
+            'rows': count,
+            'bytes': table_bytes.get(table, sum(size or 0 for size in column_bytes)),
+            'columns': {column: size or 0 for column, size in zip(columns, column_bytes)}
+        })
+    page_size = c.execute('PRAGMA page_size').fetchone()[0]
+    freelist = c.execute('PRAGMA freelist_count').fetchone()[0]
+    c.execute('SELECT DISTINCT image_hash FROM cars WHERE image_hash IS NOT NULL')
+    referenced = {row[0] for row in c.fetchall()}
+    conn.close()
+
+    files, image_bytes, unreferenced = 0, 0, 0
+    for root, _, names in os.walk(IMAGE_DIR):
+        for name in names:
+            files += 1
+            image_bytes += os.path.getsize(os.path.join(root, name))
+            unreferenced += os.path.splitext(name)[0] not in referenced
+    return {
+        'tables': rows,
+        'file_bytes': os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0,
+        'free_bytes': freelist * page_size,
+        'images': {'files': files, 'bytes': image_bytes, 'unreferenced': unreferenced}
+    }
+
+def _unreferenced(c, image_hashes):
+    # Hashes of the given images no car refers to, as seen by the writer's transaction
+    c.execute('SELECT DISTINCT image_hash FROM cars WHERE image_hash IS NOT NULL')
+    referenced = {row[0] for row in c.fetchall()}
+    return [image_hash for image_hash in image_hashes if image_hash not in referenced]
+
+def _replace_images(c, updates):
+    # Point cars at their recompressed images, then remove the old files no car uses anymore
+    for new_hash, _, data in updates:
+        # A prune committed since the new image was stored may have removed it
+        if not os.path.exists(image_path(new_hash)):
+            put_image(data)
+    old_hashes = [old_hash for _, old_hash, _ in updates]
+    c.execute(f'''SELECT id FROM cars WHERE image_hash IN ({', '.join('?' for _ in old_hashes)})''',
+              old_hashes)
+    car_ids = [row[0] for row in c.fetchall()]
+    c.executemany('UPDATE cars SET image_hash = ? WHERE image_hash = ?',
+                  [(new_hash, old_hash) for new_hash, old_hash, _ in updates])
+    for old_hash in _unreferenced(c, old_hashes):
+        after_commit(delete_image, old_hash)
+    return car_ids
+
+def recompress_images(max_side=1280, quality=80, batch_size=BATCH_SIZE):
+    """Downsize and re-encode stored images that get smaller, updating the cars using them"""
+    from PIL import Image
+
+    stats = {'checked': 0, 'recompressed': 0, 'saved_bytes': 0}
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT DISTINCT image_hash FROM cars WHERE image_hash IS NOT NULL')
+    hashes = [row[0] for row in c.fetchall()]
+    conn.close()
+    for start in range(0, len(hashes), batch_size):
+        updates = []
+        for old_hash in hashes[start:start + batch_size]:
+            data = read_image(old_hash)
+            if data is None:
+                continue
+            stats['checked'] += 1
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((max_side, max_side))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+            if buffer.tell() >= len(data):
+                continue
+            smaller = buffer.getvalue()
+            updates.append((put_image(smaller), old_hash, smaller))
+            stats['recompressed'] += 1
+            stats['saved_bytes'] += len(data) - buffer.tell()
+        if updates:
+            notify_change('save', submit_write(_replace_images, updates).result(timeout=WRITE_TIMEOUT))
+    return stats
+
+def prune_cars(max_age_days=None, keep=None):
+    """Delete cars not detected for max_age_days, and all but the newest keep cars.
+
+    Cars saved before detections were timestamped are never pruned by age.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    car_ids = set()
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 86400
+        c.execute('SELECT id FROM cars WHERE COALESCE(updated_at, created_at) < ?', (cutoff,))
+        car_ids.update(row[0] for row in c.fetchall())
+    if keep is not None:
+        c.execute('SELECT id FROM cars ORDER BY id DESC LIMIT -1 OFFSET ?', (keep,))
+        car_ids.update(row[0] for row in c.fetchall())
+    conn.close()
+    # delete_cars also removes unreferenced images and notifies the caches, once per batch
+    car_ids = sorted(car_ids)
+    for start in range(0, len(car_ids), BATCH_SIZE):
+        delete_cars(car_ids[start:start + BATCH_SIZE])
+    return len(car_ids)
+
+def _delete_old_rows(c, cutoff):
+    c.execute('DELETE FROM llm_calls WHERE created_at < ?', (cutoff,))
+    deleted = c.rowcount
+    c.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+    return deleted
+
+def prune_ledger(max_age_days):
+    """Delete LLM ledger rows, and finished detection jobs, older than max_age_days"""
+    cutoff = time.time() - max_age_days * 86400
+    return submit_write(_delete_old_rows, cutoff).result(timeout=WRITE_TIMEOUT)
+
+def _delete_unreferenced(c, image_hashes):
+    c.execute('''DELETE FROM image_embeddings WHERE image_hash NOT IN
+                 (SELECT image_hash FROM cars WHERE image_hash IS NOT NULL)''')
+    unreferenced = _unreferenced(c, image_hashes)
+    for image_hash in unreferenced:
+        after_commit(delete_image, image_hash)
+    return len(unreferenced)
+
+def prune_images():
+    """Delete stored images (and their embeddings) no car refers to.
+
+    The files are listed first, then checked and removed by the writer
+    thread, so an image a concurrent save has just referenced is kept.
+    """
+    image_hashes = []
+    for root, _, names in os.walk(IMAGE_DIR):
+        for name in names:
+            image_hash, extension = os.path.splitext(name)
+            # Skip the temporary files of images being written
+            if extension == '.jpg':
+                image_hashes.append(image_hash)
+    return submit_write(_delete_unreferenced, image_hashes).result(timeout=WRITE_TIMEOUT)
+
+def vacuum(step_pages=256):
+    """Return free pages to the file system a few pages per transaction.
+
+    The first run switches the database to incremental auto-vacuum, which
+    takes one full VACUUM. VACUUM cannot run inside a transaction, so unlike
+    other writes it uses its own connection rather than the writer thread.
+    Returns the bytes the database file shrank by.
+    """
+    size_before = os.path.getsize(DB_PATH)
+    conn = get_connection()
+    conn.isolation_level = None
+    c = conn.cursor()
+    if c.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        c.execute('VACUUM')
+    while True:
+        free = c.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        c.execute(f'PRAGMA incremental_vacuum({min(step_pages, free)})')
+        # Let waiting readers and writers in between steps
+        time.sleep(0.01)
+    conn.close()
+    return size_before - os.path.getsize(DB_PATH)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain cars.db and the image store")
+    parser.add_argument('command', choices=['stats', 'recompress', 'prune', 'vacuum'])
+    parser.add_argument('--max-side', type=int, default=1280, help="longest image side in pixels")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality of recompressed images")
+    parser.add_argument('--max-age-days', type=float, help="delete cars not detected for this long")
+    parser.add_argument('--keep', type=int, help="keep only the newest cars")
+    parser.add_argument('--ledger-days', type=float, help="delete LLM ledger rows older than this")
+    parser.add_argument('--step-pages', type=int, default=256, help="pages freed per vacuum step")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        result = storage_stats()
+    elif args.command == 'recompress':
+        result = recompress_images(args.max_side, args.quality)
+    elif args.command == 'prune':
+        result = {'cars': prune_cars(args.max_age_days, args.keep)}
+        if args.ledger_days is not None:
+            result['ledger_rows'] = prune_ledger(args.ledger_days)
+        result['images'] = prune_images()
+    else:
+        result = {'freed_bytes': vacuum(args.step_pages)}
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import re
+import copy
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from src.car_specs import get_canonical_specs, spec_cache_key
+from src.rate_limiter import PRIORITY_BACKGROUND
+from src.response_cache import is_cached
+
+# Seconds a prefetch waits before calling the model, so a car still being edited is never requested
+PREFETCH_DELAY = 1.0
+# Finished prefetches kept for the button press that usually follows
+MAX_DONE = 64
+
+_lock = threading.Lock()
+_executor = None
+# Prefetch per spec cache key: (future, cancel event)
+_jobs = {}
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='spec-prefetch')
+    return _executor
+
+def canonical_car(brand, model, year):
+    """Get the (brand, model, year) of manual input worth prefetching, or None"""
+    brand = re.sub(r'\s+', ' ', brand or '').strip()
+    model = re.sub(r'\s+', ' ', model or '').strip()
+    year = str(year or '').strip()
+    if len(brand) < 2 or not model or not re.fullmatch(r'\d{4}', year):
+        return None
+    if not 1950 <= int(year) <= datetime.date.today().year + 1:
+        return None
+    return brand, model, year
+
+def _run(car, text_model, cancelled):
+    time.sleep(PREFETCH_DELAY)
+    if cancelled.is_set():
+        raise CancelledError()
+    return get_canonical_specs(*car, text_model, priority=PRIORITY_BACKGROUND)
+
+def prefetch_specs(brand, model, year, text_model):
+    """Start generating a car's specs in the background and return its cache key.
+
+    Nothing is started for implausible input, for cars already cached or
+    already being prefetched.
+    """
+    car = canonical_car(brand, model, year)
+    if car is None or text_model is None:
+        return None
+    key = spec_cache_key(*car)
+    with _lock:
+        job = _jobs.get(key)
+        if job and not job[0].cancelled() and not job[1].is_set():
+            return key
+    if is_cached(key):
+        return key
+
+    cancelled = threading.Event()
+    future = _get_executor().submit(_run, car, text_model, cancelled)
+    with _lock:
+        _jobs[key] = (future, cancelled)
+        # Forget the oldest finished prefetches; their specs stay in the response cache
+        done = [old_key for old_key, (old_future, _) in _jobs.items() if old_future.done()]
+        for old_key in done[:max(0, len(done) - MAX_DONE)]:
+            del _jobs[old_key]
+    return key
+
+def cancel_prefetch(key):
+    """Cancel a prefetch that has not called the model yet"""
+    with _lock:
+        job = _jobs.pop(key, None)
+    if job:
+        job[1].set()
+        job[0].cancel()
+
+def get_prefetched_specs(brand, model, year, text_model):
+    """Get a car's canonical specs, waiting for its prefetch when one is running"""
+    car = canonical_car(brand, model, year)
+    if car is None:
+        return get_canonical_specs(brand, model, year, text_model)
+    with _lock:
+        job = _jobs.get(spec_cache_key(*car))
+    if job and not job[1].is_set():
+        try:
+            # The result is shared by every session that waited for it
+            return copy.deepcopy(job[0].result())
+        except Exception as e:
+            # A failed prefetch is retried in the foreground below
+            print(f"Spec prefetch failed: {str(e)}")
+    return get_canonical_specs(*car, text_model)
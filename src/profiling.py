@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import functools
+import contextlib
+import streamlit as st
+from src.config import load_env
+
+load_env()
+
+# Set CAR_APP_PROFILE=1 to time the stages of every script run
+ENABLED = os.getenv('CAR_APP_PROFILE', '') == '1'
+
+# Longest text kept on a span (e.g. a raw model response)
+MAX_FIELD_CHARS = 2000
+
+logger = logging.getLogger('car_app.profile')
+if ENABLED and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Spans of the script run executing on this thread
+_local = threading.local()
+
+def start_run(page):
+    """Start collecting spans for one script run of a page"""
+    if not ENABLED:
+        return
+    _local.run = {
+        'page': page,
+        'run_id': uuid.uuid4().hex[:8],
+        'start': time.perf_counter(),
+        'spans': [],
+        'depth': 0
+    }
+
+def _field(value):
+    if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+        return value[:MAX_FIELD_CHARS] + '…'
+    return value
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """Time a stage of the current run.
+
+    Yields a dict the caller can add fields to, e.g. the raw model response.
+    Does nothing unless profiling is enabled.
+    """
+    if not ENABLED:
+        yield {}
+        return
+    run = getattr(_local, 'run', None)
+    info = dict(fields)
+    depth = 0
+    if run is not None:
+        depth = run['depth']
+        run['depth'] += 1
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info['error'] = str(e)
+        raise
+    finally:
+        record = {
+            'span': name,
+            'ms': round((time.perf_counter() - start) * 1000, 2),
+            'depth': depth,
+            'thread': threading.current_thread().name
+        }
+        if run is not None:
+            run['depth'] -= 1
+            record['run_id'] = run['run_id']
+            record['page'] = run['page']
+            record['offset_ms'] = round((start - run['start']) * 1000, 2)
+        record.update({key: _field(value) for key, value in info.items()})
+        logger.info(json.dumps(record, default=str, ensure_ascii=False))
+        if run is not None:
+            run['spans'].append(record)
+
+def profiled(name):
+    """Decorator timing every call of a function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def estimate_size(value, _seen=None):
+    """Roughly estimate the memory held by a value, following containers"""
+    _seen = set() if _seen is None else _seen
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, _seen) + estimate_size(item, _seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    elif hasattr(value, 'size') and hasattr(value, 'getbands'):
+        # Decoded PIL images keep their pixels outside the Python object
+        size += value.size[0] * value.size[1] * len(value.getbands())
+    return size
+
+def session_memory():
+    """Get the estimated memory of each session state entry, largest first"""
+    rows = [{'key': str(key), 'bytes': estimate_size(value)} for key, value in st.session_state.items()]
+    return sorted(rows, key=lambda row: row['bytes'], reverse=True)
+
+def render_debug_panel():
+    """Show the spans of the current run in a collapsible panel"""
+    run = getattr(_local, 'run', None) if ENABLED else None
+    if run is None:
+        return
+    total_ms = (time.perf_counter() - run['start']) * 1000
+    with st.expander(f"Debug: {run['page']} run {run['run_id']} ({total_ms:.0f} ms)"):
+        st.dataframe(
+            [{key: span[key] for key in ('span', 'offset_ms', 'ms', 'depth') if key in span}
+             for span in sorted(run['spans'], key=lambda span: span.get('offset_ms', 0))],
+            use_container_width=True
+        )
+        memory = session_memory()
+        st.write(f"**Session state: {sum(row['bytes'] for row in memory) / 1024:.1f} KB**")
+        st.dataframe(memory, use_container_width=True)
+        for record in run['spans']:
+            extra = {key: value for key, value in record.items()
+                     if key not in ('span', 'ms', 'depth', 'thread', 'run_id', 'page', 'offset_ms')}
+            if extra:
+                st.write(f"**{record['span']}**")
+                st.json(extra, expanded=False)
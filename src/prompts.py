@@ -0,0 +1,267 @@
+import json
+import hashlib
+import string
+
+# Structure of the specifications every specs prompt asks for
+SPEC_SCHEMA = {
+    "basic_info": ["brand", "model", "year", "type"],
+    "performance": ["fuel_consumption", "engine_size", "cylinders", "transmission", "fuel_type",
+                    "horsepower", "torque", "top_speed", "acceleration"],
+    "technical_specs": ["length", "width", "height", "wheelbase", "weight",
+                        "seating_capacity", "trunk_capacity"],
+    "features": ["price_range", "safety_features", "comfort_features", "technology_features"]
+}
+
+# Fields of SPEC_SCHEMA holding lists instead of strings
+SPEC_LIST_FIELDS = {"safety_features", "comfort_features", "technology_features"}
+
+# Units of the numeric fields in the language-neutral (canonical) specifications
+SPEC_UNITS = {
+    "fuel_consumption": "L/100km", "engine_size": "cc", "cylinders": "", "horsepower": "hp",
+    "torque": "Nm", "top_speed": "km/h", "acceleration": "s (0-100 km/h)",
+    "length": "mm", "width": "mm", "height": "mm", "wheelbase": "mm", "weight": "kg",
+    "seating_capacity": "", "trunk_capacity": "L"
+}
+
+# Ids allowed for the categorical fields of the canonical specifications
+SPEC_ENUMS = {
+    "type": ["sedan", "suv", "crossover", "hatchback", "coupe", "convertible", "wagon",
+             "pickup", "van", "minivan", "sports_car", "luxury"],
+    "transmission": ["automatic", "manual", "cvt", "dct"],
+    "fuel_type": ["petrol", "diesel", "hybrid", "plug_in_hybrid", "electric"]
+}
+
+# Ids of the common features, localized from label tables instead of translated
+FEATURE_IDS = {
+    "safety_features": ["abs", "airbags", "esc", "traction_control", "automatic_emergency_braking",
+                        "forward_collision_warning", "lane_departure_warning", "lane_keeping_assist",
+                        "blind_spot_monitoring", "rear_cross_traffic_alert", "adaptive_cruise_control",
+                        "parking_sensors", "rear_camera", "camera_360", "isofix"],
+    "comfort_features": ["climate_control", "dual_zone_climate_control", "heated_seats",
+                         "ventilated_seats", "leather_seats", "power_seats", "sunroof",
+                         "keyless_entry", "push_button_start", "power_tailgate", "cruise_control"],
+    "technology_features": ["touchscreen", "navigation", "apple_carplay", "android_auto",
+                            "bluetooth", "wireless_charging", "premium_audio", "digital_cluster",
+                            "head_up_display", "usb_ports"]
+}
+
+def _compact(value):
+    # Minified JSON, escaped so it can sit inside a format template
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('{', '{{').replace('}', '}}')
+
+def _spec_schema():
+    return {section: {field: [] if field in SPEC_LIST_FIELDS else "" for field in fields}
+            for section, fields in SPEC_SCHEMA.items()}
+
+def _comparison_schema():
+    def pair(fields):
+        return {"car1": dict.fromkeys(fields, ""), "car2": dict.fromkeys(fields, ""),
+                "winner": "", "reason": ""}
+    return {
+        "engine_comparison": pair(["power", "torque", "acceleration", "top_speed"]),
+        "fuel_efficiency": pair(["city", "highway", "combined"]),
+        "maintenance": pair(["service_interval", "maintenance_cost", "reliability"]),
+        "value_for_money": pair(["price", "resale_value", "features"]),
+        "final_recommendation": dict.fromkeys(["best_choice", "reason", "suitable_for", "considerations"], "")
+    }
+
+def estimate_tokens(text):
+    """Roughly estimate the token count of a text without calling the API"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    # Arabic script tokenizes to far fewer characters per token than English
+    return round(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+class PromptTemplate:
+    """A versioned prompt template, parsed once when it is registered"""
+
+    def __init__(self, name, language, version, text):
+        self.name = name
+        self.language = language
+        self.version = version
+        self.text = text
+        self._parts = list(string.Formatter().parse(text))
+        self.fields = {field for _, field, _, _ in self._parts if field}
+        self.static = not self.fields
+        # The rendered text of templates without fields never changes
+        self._rendered = text.format() if self.static else None
+        self.estimated_tokens = estimate_tokens(self._rendered or text)
+
+    @property
+    def key(self):
+        return f"{self.name}:{self.language}:v{self.version}"
+
+    def render(self, **values):
+        """Fill in the template fields"""
+        if self.static:
+            return self._rendered
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Missing prompt fields for {self.key}: {', '.join(sorted(missing))}")
+        rendered = []
+        for literal, field, spec, conversion in self._parts:
+            rendered.append(literal)
+            if field:
+                rendered.append(format(values[field], spec or ''))
+        return ''.join(rendered)
+
+    def cache_key(self, **values):
+        """Build a cache key from the template version and its field values"""
+        normalized = json.dumps({key: str(value).strip().lower() for key, value in values.items()},
+                                sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(f"{self.key}:{normalized}".encode('utf-8')).hexdigest()
+
+_registry = {}
+
+def register(name, language, text, version=1):
+    """Register a prompt template under a name and language"""
+    template = PromptTemplate(name, language, version, text)
+    _registry[(name, language)] = template
+    return template
+
+def get_prompt(name, language):
+    """Get a registered prompt template"""
+    try:
+        return _registry[(name, language)]
+    except KeyError:
+        raise KeyError(f"No '{name}' prompt registered for {language}")
+
+def list_prompts():
+    """Get every registered prompt template"""
+    return sorted(_registry.values(), key=lambda template: (template.name, template.language))
+
+def measure_prompts(model=None):
+    """Get the size of every template, with exact token counts when a model is given"""
+    rows = []
+    for template in list_prompts():
+        # Measure templates with fields on a typical car
+        text = template.render(**{field: _SAMPLE_VALUES.get(field, 'x') for field in template.fields})
+        row = {
+            'prompt': template.key,
+            'chars': len(text),
+            'estimated_tokens': estimate_tokens(text)
+        }
+        if model is not None:
+            row['tokens'] = model.count_tokens(text).total_tokens
+        rows.append(row)
+    return rows
+
+_SAMPLE_VALUES = {'year': 2020, 'brand': 'Toyota', 'model': 'Corolla'}
+
+_SPEC_JSON = _compact(_spec_schema())
+
+register('detection', 'Arabic',
+         'حدد السيارة في الصورة. أرجع JSON فقط بدون أي نص آخر، '
+         'والنوع مثل SUV أو Sedan:\n'
+         + _compact({"brand": "", "model": "", "year": "", "type": ""}))
+
+register('detection', 'English',
+         'Identify the car in the image. Return only JSON, no other text, '
+         'with type like SUV or Sedan:\n'
+         + _compact({"brand": "", "model": "", "year": "", "type": ""}))
+
+# Several cars per photo; box is [ymin, xmin, ymax, xmax] scaled to 0-1000
+register('detection_multi', 'Arabic',
+         'حدد كل سيارة ظاهرة بوضوح في الصورة. أرجع مصفوفة JSON فقط بدون أي نص آخر، '
+         'بعنصر لكل سيارة، والنوع مثل SUV أو Sedan، و box هو [ymin, xmin, ymax, xmax] '
+         'بمقياس من 0 إلى 1000:\n'
+         + _compact([{"brand": "", "model": "", "year": "", "type": "", "box": [0, 0, 0, 0]}]))
+
+register('detection_multi', 'English',
+         'Identify every clearly visible car in the image. Return only a JSON array, no other text, '
+         'with one item per car, type like SUV or Sedan and box as [ymin, xmin, ymax, xmax] '
+         'scaled to 0-1000:\n'
+         + _compact([{"brand": "", "model": "", "year": "", "type": "", "box": [0, 0, 0, 0]}]))
+
+# Specifications are generated once per car in a language-neutral form (numbers in
+# fixed units and ids from the vocabularies above) and localized by src/language.py
+_SPEC_FIELD_NAMES = ','.join(field for fields in SPEC_SCHEMA.values() for field in fields)
+_SPEC_FIELD_COUNT = sum(len(fields) for fields in SPEC_SCHEMA.values())
+_SPEC_CANONICAL_RULES = (
+    'Values are numbers in these units, null when unknown: '
+    + ', '.join(f'{field} {unit}' for field, unit in SPEC_UNITS.items() if unit) + '. '
+    'price_range is [min, max] in USD. '
+    + ' '.join(f'{field} is one of {"|".join(ids)}.' for field, ids in SPEC_ENUMS.items())
+    + ' Features are arrays of these ids, or a short English phrase for a feature not listed: '
+    + ' '.join(f'{field}: {",".join(ids)}.' for field, ids in FEATURE_IDS.items())
+)
+
+register('specs', 'English',
+         'Specifications of the {year} {brand} {model}. Return only JSON, no other text, '
+         'in this structure. ' + _SPEC_CANONICAL_RULES.replace('{', '{{').replace('}', '}}')
+         + '\n' + _SPEC_JSON, version=2)
+
+# Compact wire format: one JSON array, expanded locally by src/spec_format.py
+register('specs_compact', 'English',
+         'Specifications of the {year} {brand} {model}. Return only a JSON array, no other text, '
+         f'of {_SPEC_FIELD_COUNT} values in this order: {_SPEC_FIELD_NAMES}. '
+         + _SPEC_CANONICAL_RULES.replace('{', '{{').replace('}', '}}'), version=2)
+
+# Compact specifications of several cars in one call, one array per car
+register('specs_compact_batch', 'English',
+         'Specifications of each of these cars, one per line:\n{cars}\n'
+         'Return only a JSON array, no other text, with one array per car in the same order, '
+         f'each of {_SPEC_FIELD_COUNT} values in this order: {_SPEC_FIELD_NAMES}. '
+         + _SPEC_CANONICAL_RULES.replace('{', '{{').replace('}', '}}'))
+
+register('translation', 'Arabic',
+         'ترجم كل عنصر في مصفوفة JSON التالية إلى العربية بإيجاز. '
+         'أرجع مصفوفة JSON فقط بدون أي نص آخر، بنفس الطول والترتيب:\n{items}')
+
+register('translation', 'English',
+         'Translate each item of this JSON array to English, briefly. '
+         'Return only a JSON array, no other text, of the same length and order:\n{items}')
+
+register('specs_flat', 'English',
+         'Specifications of the {year} {brand} {model}. Return only JSON, no other text. '
+         'Use the given brand, model and year exactly, numbers as numbers '
+         '(fuel_consumption L/100km, engine_size cc, torque Nm, top_speed km/h, '
+         'acceleration 0-100 km/h in s, price_range USD) and null when unknown:\n'
+         + _compact({"brand": "", "model": "", "year": 0, "fuel_consumption": 0.0,
+                     "engine_size": 0, "cylinders": 0, "transmission": "", "fuel_type": "",
+                     "horsepower": 0, "torque": 0, "top_speed": 0, "acceleration": 0.0,
+                     "price_range": "", "safety_features": [], "comfort_features": [],
+                     "technology_features": []}))
+
+register('comparison', 'Arabic',
+         'قارن بين السيارتين مع التركيز على ما يهم المشتري:\n'
+         'السيارة الأولى (car1): {car1}\n'
+         'السيارة الثانية (car2): {car2}\n'
+         'أرجع JSON فقط بدون أي نص آخر، بهذه البنية، وجميع القيم باللغة العربية:\n'
+         + _compact(_comparison_schema()))
+
+register('comparison_text', 'English',
+         'Compare these two cars:\nCar 1: {car1}\nCar 2: {car2}\n'
+         'Use clear sections with bullet points: 1. Overall comparison '
+         '2. Performance 3. Technical specifications 4. Pros and cons of each car '
+         '5. Recommendation for different use cases.')
+
+register('detection_text', 'English',
+         'Identify this car. Answer in exactly these lines, as specific about model and year as possible:\n'
+         'Make: [brand]\nModel: [model]\nYear: [year]\nType: [vehicle type]')
+
+# One call for several interior photos; each answer section starts with "### [n]"
+register('interior', 'Arabic',
+         'هذه {count} صور من داخل سيارة. لكل صورة بالترتيب اكتب قسماً يبدأ بسطر "### [n]" '
+         '(حيث n رقم الصورة)، وصف فيه ما تراه باللغة العربية. لكل شيء اذكر بشكل منظم: '
+         'نوعه، موقعه في السيارة، وظيفته، وأي تفاصيل مهمة.', version=2)
+
+register('interior', 'English',
+         'These are {count} photos taken inside a car. For each photo, in order, write a section '
+         'starting with a line "### [n]" (n being the photo number) describing what you see. '
+         'For each thing, give in an organized way: what it is, where it is in the car, '
+         'what it does, and any important details.', version=2)
+
+register('model_list', 'Arabic',
+         'جميع موديلات سيارات {brand}. أرجع JSON فقط بدون أي نص آخر، والقيم باللغة العربية:\n'
+         + _compact({"models": [{"name": "", "years": [], "type": ""}]}))
+
+register('brand_list', 'Arabic',
+         'جميع شركات تصنيع السيارات المعروفة. أرجع JSON فقط بدون أي نص آخر، والقيم باللغة العربية:\n'
+         + _compact({"brands": [{"name": "", "country": ""}]}))
+
+register('brand_info', 'Arabic',
+         'معلومات عن سيارات {brand}. أرجع JSON فقط بدون أي نص آخر، والقيم باللغة العربية '
+         '(الأوصاف مختصرة):\n'
+         + _compact({"brand_info": {"name": "", "country": "", "founded_year": "", "description": ""},
+                     "popular_models": [{"name": "", "years": [], "type": "", "description": ""}],
+                     "car_types": []}))
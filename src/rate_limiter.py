@@ -0,0 +1,167 @@
+import os
+import time
+import heapq
+import hashlib
+import itertools
+import threading
+from src.config import load_env
+
+load_env()
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+PRIORITY_BACKGROUND = 20
+
+# Requests per minute and burst size allowed for each API key
+RATE_PER_MINUTE = float(os.getenv('GEMINI_RPM', '15'))
+BURST = float(os.getenv('GEMINI_BURST', '5'))
+
+# Seconds a caller may wait in the queue before giving up
+QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', '120'))
+
+# Share the token buckets with other processes through cars.db
+SHARED = os.getenv('GEMINI_RATE_LIMIT_SHARED', '') == '1'
+
+class RateLimitTimeout(Exception):
+    pass
+
+class _Bucket:
+    """Token bucket and priority queue of waiters for one API key"""
+
+    def __init__(self, key_id, rate, capacity):
+        self.key_id = key_id
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiters = []
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.last_wait = 0.0
+
+    def take(self):
+        """Take a token, returning 0 or the seconds until one is available"""
+        if SHARED:
+            return _take_shared(self.key_id, self.rate, self.capacity)
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self):
+        """Empty the bucket after the API reported the quota as exhausted"""
+        if SHARED:
+            _drain_shared(self.key_id)
+        self.tokens = 0
+        self.updated_at = time.monotonic()
+
+_lock = threading.Lock()
+_buckets = {}
+_sequence = itertools.count()
+
+def _key_id(api_key):
+    # Never keep raw API keys around, in memory stats or in the database
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+def _get_bucket(api_key):
+    key_id = _key_id(api_key)
+    with _lock:
+        bucket = _buckets.get(key_id)
+        if bucket is None:
+            bucket = _Bucket(key_id, RATE_PER_MINUTE / 60.0, BURST)
+            _buckets[key_id] = bucket
+        return bucket
+
+def _write_take(c, key_id, rate, capacity):
+    # Runs in the writer's transaction, which holds the database write lock
+    row = c.execute('SELECT tokens, updated_at FROM rate_limits WHERE key_id = ?', (key_id,)).fetchone()
+    now = time.time()
+    tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+    delay = 0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        delay = (1 - tokens) / rate
+    c.execute('INSERT OR REPLACE INTO rate_limits (key_id, tokens, updated_at) VALUES (?, ?, ?)',
+              (key_id, tokens, now))
+    return delay
+
+def _write_drain(c, key_id):
+    c.execute('INSERT OR REPLACE INTO rate_limits (key_id, tokens, updated_at) VALUES (?, 0, ?)',
+              (key_id, time.time()))
+
+def _take_shared(key_id, rate, capacity):
+    from src.database import WRITE_TIMEOUT, submit_write
+    return submit_write(_write_take, key_id, rate, capacity).result(timeout=WRITE_TIMEOUT)
+
+def _drain_shared(key_id):
+    from src.database import WRITE_TIMEOUT, submit_write
+    submit_write(_write_drain, key_id).result(timeout=WRITE_TIMEOUT)
+
+def acquire(api_key, priority=PRIORITY_INTERACTIVE, timeout=QUEUE_TIMEOUT):
+    """Wait for a request slot for an API key and return the seconds waited.
+
+    Waiters are served strictly by priority, then arrival order, so an
+    interactive request jumps ahead of queued bulk or background work.
+    """
+    bucket = _get_bucket(api_key)
+    entry = (priority, next(_sequence))
+    start = time.monotonic()
+    with bucket.cond:
+        heapq.heappush(bucket.waiters, entry)
+        try:
+            while True:
+                delay = None
+                if bucket.waiters[0] == entry:
+                    delay = bucket.take()
+                    if delay == 0:
+                        break
+                remaining = None
+                if timeout is not None:
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise RateLimitTimeout("Timed out waiting for a Gemini request slot")
+                if delay is None or remaining is None:
+                    bucket.cond.wait(delay if delay is not None else remaining)
+                else:
+                    bucket.cond.wait(min(delay, remaining))
+        finally:
+            bucket.waiters.remove(entry)
+            heapq.heapify(bucket.waiters)
+            bucket.cond.notify_all()
+
+        waited = time.monotonic() - start
+        bucket.wait_count += 1
+        bucket.wait_total += waited
+        bucket.wait_max = max(bucket.wait_max, waited)
+        bucket.last_wait = waited
+    return waited
+
+def penalize(api_key):
+    """Drain an API key's bucket after a 429 so queued callers back off"""
+    bucket = _get_bucket(api_key)
+    with bucket.cond:
+        bucket.drain()
+
+def get_queue_stats():
+    """Get queue length and wait times for every API key seen by this process"""
+    with _lock:
+        buckets = list(_buckets.values())
+    stats = []
+    for bucket in buckets:
+        with bucket.cond:
+            stats.append({
+                'key_id': bucket.key_id,
+                'waiting': len(bucket.waiters),
+                'requests': bucket.wait_count,
+                'avg_wait': bucket.wait_total / bucket.wait_count if bucket.wait_count else 0.0,
+                'max_wait': bucket.wait_max,
+                'last_wait': bucket.last_wait
+            })
+    return stats
@@ -0,0 +1,47 @@
+import json
+import time
+from src.database import WRITE_TIMEOUT, get_connection, submit_write
+
+def _count_hit(c, key):
+    c.execute('UPDATE response_cache SET hits = hits + 1 WHERE key = ?', (key,))
+
+def _put(c, key, call_type, value):
+    c.execute('''INSERT OR REPLACE INTO response_cache (key, call_type, value, created_at, hits)
+                 VALUES (?, ?, ?, ?, 0)''', (key, call_type, value, time.time()))
+
+def get_cached(key):
+    """Get a cached model answer, or None when it has not been cached"""
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute('SELECT value FROM response_cache WHERE key = ?', (key,))
+        row = c.fetchone()
+        conn.close()
+        if row:
+            # Nobody waits for the hit counter; the writer commits it with the next writes
+            submit_write(_count_hit, key)
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        # A broken cache only costs a model call
+        print(f"Error reading response cache: {str(e)}")
+        return None
+
+def is_cached(key):
+    """Check whether a model answer is cached, without counting it as a hit"""
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute('SELECT 1 FROM response_cache WHERE key = ?', (key,))
+        cached = c.fetchone() is not None
+        conn.close()
+        return cached
+    except Exception as e:
+        print(f"Error reading response cache: {str(e)}")
+        return False
+
+def put_cached(key, call_type, value):
+    """Cache a parsed model answer"""
+    try:
+        submit_write(_put, key, call_type, json.dumps(value, ensure_ascii=False)).result(timeout=WRITE_TIMEOUT)
+    except Exception as e:
+        print(f"Error writing response cache: {str(e)}")
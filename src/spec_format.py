@@ -0,0 +1,34 @@
+from src.prompts import SPEC_SCHEMA, SPEC_LIST_FIELDS
+
+# Position of every field in a compact specs response
+SPEC_FIELDS = [(section, field) for section, fields in SPEC_SCHEMA.items() for field in fields]
+
+def expand_specs(values):
+    """Rebuild the nested specifications from a compact (positional) response.
+
+    The array must hold exactly one value per field: with one missing,
+    every later field would silently shift by one. A response that already
+    uses the nested structure is returned as is.
+    """
+    if isinstance(values, dict) and all(section in values for section in SPEC_SCHEMA):
+        return values
+    if not isinstance(values, list):
+        raise ValueError("Compact specifications must be a JSON array")
+    if len(values) != len(SPEC_FIELDS):
+        raise ValueError(f"Expected {len(SPEC_FIELDS)} values, got {len(values)}")
+
+    specs = {section: {} for section in SPEC_SCHEMA}
+    for (section, field), value in zip(SPEC_FIELDS, values):
+        if field in SPEC_LIST_FIELDS:
+            if value is None:
+                value = []
+            elif not isinstance(value, list):
+                value = [value]
+        elif value is None:
+            value = ""
+        specs[section][field] = value
+    return specs
+
+def compact_specs(specs):
+    """Flatten nested specifications into the compact positional form"""
+    return [specs.get(section, {}).get(field) for section, field in SPEC_FIELDS]
@@ -0,0 +1,133 @@
+import re
+import json
+import warnings
+import threading
+import numpy as np
+from src.database import get_connection, add_change_listener
+from src.prompts import SPEC_SCHEMA, SPEC_UNITS
+
+# Numeric fields compared between cars, with the price as the middle of its range
+FEATURES = [(section, field) for section, fields in SPEC_SCHEMA.items() for field in fields
+            if field in SPEC_UNITS] + [('features', 'price_range')]
+# Cars with fewer known values are left out of the recommendations
+MIN_KNOWN = 3
+
+_lock = threading.Lock()
+# Raw values (NaN when unknown) and standardized values of the cars _ids, in the same order
+_ids = None
+_raw = None
+_scaled = None
+# Cars saved or deleted since the index was last refreshed
+_pending = set()
+
+_NUMBER = re.compile(r'\d+(?:,\d{3})*(?:\.\d+)?')
+# Numbers of units rather than values, as in "6.5 L/100km" or "9.8 s (0-100 km/h)"
+_UNIT_NUMBERS = re.compile(r'/\s*100\s*km|0\s*-\s*100\s*km/h')
+
+def _number(value, average=False):
+    # Canonical specs hold numbers; older ones strings like "139 hp" or "$20,000 - $25,000"
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        numbers = [_number(item) for item in value]
+    elif isinstance(value, str):
+        numbers = [float(match.replace(',', ''))
+                   for match in _NUMBER.findall(_UNIT_NUMBERS.sub('', value))]
+    else:
+        return None
+    numbers = [number for number in numbers if number is not None]
+    if not numbers:
+        return None
+    # Ranges (prices) count as their middle, other strings as their first number
+    return sum(numbers) / len(numbers) if average or not isinstance(value, str) else numbers[0]
+
+def spec_vector(specs):
+    """Get the numeric features of a car's specifications, NaN where unknown"""
+    vector = []
+    for section, field in FEATURES:
+        values = specs.get(section) if isinstance(specs, dict) else None
+        number = (_number(values.get(field), average=field == 'price_range')
+                  if isinstance(values, dict) else None)
+        if number is not None and field == 'engine_size' and number < 20:
+            # Litres rather than cc
+            number *= 1000
+        vector.append(np.nan if number is None else number)
+    return np.array(vector, dtype=np.float64)
+
+def _load_rows(c, car_ids=None):
+    query = 'SELECT id, specs FROM cars'
+    params = []
+    if car_ids is not None:
+        query += f" WHERE id IN ({', '.join('?' for _ in car_ids)})"
+        params = car_ids
+    c.execute(query, params)
+    ids, vectors = [], []
+    for car_id, specs in c.fetchall():
+        try:
+            vector = spec_vector(json.loads(specs))
+        except (TypeError, ValueError):
+            continue
+        if np.count_nonzero(~np.isnan(vector)) >= MIN_KNOWN:
+            ids.append(car_id)
+            vectors.append(vector)
+    return np.array(ids, dtype=np.int64), np.array(vectors).reshape(len(ids), len(FEATURES))
+
+def _standardize(raw):
+    # z-scores per feature over the library; unknown values sit at the mean
+    with warnings.catch_warnings():
+        # Features no car knows yet have no mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(raw, axis=0)
+        std = np.nanstd(raw, axis=0)
+    mean = np.nan_to_num(mean)
+    std = np.where(np.nan_to_num(std) > 0, np.nan_to_num(std), 1.0)
+    return np.nan_to_num((raw - mean) / std)
+
+def _refresh():
+    # Load the index on first use, then apply the saves and deletes since the last query
+    global _ids, _raw, _scaled
+    if _ids is not None and not _pending:
+        return
+    conn = get_connection()
+    try:
+        if _ids is None:
+            _pending.clear()
+            _ids, _raw = _load_rows(conn.cursor())
+        else:
+            changed = sorted(_pending)
+            _pending.clear()
+            ids, raw = _load_rows(conn.cursor(), changed)
+            keep = ~np.isin(_ids, changed)
+            _ids = np.concatenate([_ids[keep], ids])
+            _raw = np.concatenate([_raw[keep], raw])
+    finally:
+        conn.close()
+    _scaled = _standardize(_raw)
+
+def similar_cars(car_id, k=5):
+    """Get the (car id, similarity from 0 to 1) of the saved cars with the closest numeric specs"""
+    with _lock:
+        _refresh()
+        ids, raw, scaled = _ids, _raw, _scaled
+    position = np.flatnonzero(ids == car_id)
+    if not len(position) or len(ids) < 2:
+        return []
+    position = position[0]
+
+    # Compare only the features known for this car, as a root mean square z-score distance
+    known = ~np.isnan(raw[position])
+    distances = np.sqrt(((scaled[:, known] - scaled[position, known]) ** 2).mean(axis=1))
+    distances[position] = np.inf
+    k = min(k, len(ids) - 1)
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return [(int(ids[i]), float(1 / (1 + distances[i]))) for i in top]
+
+def _on_change(event, car_ids):
+    with _lock:
+        _pending.update(car_ids)
+
+# Specs are refreshed lazily, on the next query after a save or delete
+add_change_listener(_on_change)
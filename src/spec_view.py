@@ -0,0 +1,79 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import streamlit as st
+from src.language import SPEC_LABELS, get_language_texts, localize_specs
+from src.profiling import span
+from src.prompts import SPEC_SCHEMA, SPEC_LIST_FIELDS
+
+# Rendered markdown per (car, language, translating), least recently used dropped first
+_MAX_RENDERED = 256
+_rendered = OrderedDict()
+_lock = threading.Lock()
+
+# Keys of get_language_texts titling each section and list field
+_SECTION_TEXTS = {"basic_info": "basic_info", "performance": "performance",
+                  "technical_specs": "technical", "features": "features"}
+_FEATURE_TEXTS = {"price_range": "price", "safety_features": "safety",
+                  "comfort_features": "comfort", "technology_features": "tech"}
+
+def _text(value):
+    text = "" if value is None else str(value).replace("\n", " ").strip()
+    return text or "-"
+
+def specs_markdown(specs, language, text_model=None):
+    """Build the markdown of a car's specifications, tolerating missing sections and fields"""
+    texts = get_language_texts(language)
+    labels = SPEC_LABELS["Arabic" if language == "Arabic" else "English"]["fields"]
+    specs = localize_specs(specs or {}, language, text_model)
+
+    blocks = [f"### {texts['specs']}"]
+    for section, fields in SPEC_SCHEMA.items():
+        values = specs.get(section)
+        if not isinstance(values, dict):
+            values = {}
+        blocks.append(f"#### {texts[_SECTION_TEXTS[section]]}")
+        lines = []
+        for field in fields:
+            value = values.get(field)
+            if field in SPEC_LIST_FIELDS:
+                items = value if isinstance(value, list) else [value] if value else []
+                if not items:
+                    lines.append(f"**{texts[_FEATURE_TEXTS[field]]}:** -")
+                    continue
+                lines.append(f"**{texts[_FEATURE_TEXTS[field]]}:**")
+                blocks.append("  \n".join(lines))
+                blocks.append("\n".join(f"- {_text(item)}" for item in items))
+                lines = []
+            else:
+                label = labels.get(field) or texts[_FEATURE_TEXTS[field]]
+                lines.append(f"**{label}:** {_text(value)}")
+        if lines:
+            blocks.append("  \n".join(lines))
+    return "\n\n".join(blocks)
+
+def render_specs(specs, language, car_id=None, text_model=None):
+    """Render a car's specifications as a single markdown element.
+
+    The markdown is memoized per car id and language, and rebuilt when the
+    specs of that car change.
+    """
+    digest = hashlib.sha1(json.dumps(specs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    key = (car_id if car_id is not None else digest, language, text_model is not None)
+    with span('render.specs', cached=False) as info:
+        with _lock:
+            entry = _rendered.get(key)
+            if entry and entry[0] == digest:
+                _rendered.move_to_end(key)
+        if entry and entry[0] == digest:
+            markdown = entry[1]
+            info['cached'] = True
+        else:
+            markdown = specs_markdown(specs, language, text_model)
+            with _lock:
+                _rendered[key] = (digest, markdown)
+                _rendered.move_to_end(key)
+                while len(_rendered) > _MAX_RENDERED:
+                    _rendered.popitem(last=False)
+        st.markdown(markdown)
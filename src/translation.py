@@ -0,0 +1,64 @@
+import json
+from src.database import WRITE_TIMEOUT, get_connection, submit_write
+from src.llm_ledger import load_json
+from src.prompts import get_prompt
+
+def _has_arabic(text):
+    return any('\u0600' <= char <= '\u06ff' for char in text)
+
+def _put_translations(c, rows):
+    c.executemany('INSERT OR REPLACE INTO translations (source, language, text) VALUES (?, ?, ?)', rows)
+
+def needs_translation(text, language):
+    """Check whether a free-text item is written in another language than the target one"""
+    if not isinstance(text, str) or not text.strip():
+        return False
+    if language == 'Arabic':
+        return not _has_arabic(text) and any(char.isalpha() for char in text)
+    return _has_arabic(text)
+
+def get_cached_translations(items, language):
+    """Get the cached translations of the given items"""
+    if not items:
+        return {}
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        placeholders = ', '.join('?' for _ in items)
+        c.execute(f'''SELECT source, text FROM translations
+                      WHERE language = ? AND source IN ({placeholders})''',
+                  (language, *items))
+        translations = dict(c.fetchall())
+        conn.close()
+        return translations
+    except Exception as e:
+        print(f"Error reading translations: {str(e)}")
+        return {}
+
+def translate_texts(items, language, text_model=None):
+    """Translate short free-text items, calling the model only for uncached ones.
+
+    Returns a dict from item to translation. Items that cannot be translated
+    (no model, or a failed call) are left out, so callers show the original.
+    """
+    items = sorted({item for item in items if needs_translation(item, language)})
+    translations = get_cached_translations(items, language)
+    missing = [item for item in items if item not in translations]
+    if not missing or text_model is None:
+        return translations
+
+    try:
+        prompt = get_prompt('translation', language).render(items=json.dumps(missing, ensure_ascii=False))
+        response = text_model.generate_content(prompt, call_type='translation', language=language)
+        translated = load_json(response, response.text[response.text.find('['):response.text.rfind(']') + 1])
+        if not isinstance(translated, list) or len(translated) != len(missing):
+            raise ValueError(f"Expected {len(missing)} translations, got {translated!r}")
+
+        new = {source: str(text) for source, text in zip(missing, translated) if text}
+        submit_write(_put_translations, [(source, language, text) for source, text in new.items()]
+                     ).result(timeout=WRITE_TIMEOUT)
+        translations.update(new)
+    except Exception as e:
+        # Untranslated items are still readable, so never fail the page over them
+        print(f"Error translating spec items: {str(e)}")
+    return translations